@@ -0,0 +1,114 @@
+# backend_api/app/answer_cache.py
+
+import os
+import time
+import threading
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Configuration ---
+# A cached answer is reused when the cosine similarity between the new query
+# embedding and a cached query embedding is at least ANSWER_CACHE_SIMILARITY.
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_MAX_PER_COMPANY = int(os.getenv("ANSWER_CACHE_MAX_PER_COMPANY", "500"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "86400"))
+
+
+class SemanticAnswerCache:
+    """
+    Per-company cache of chat answers looked up by query-embedding similarity.
+    Each company has a generation counter that is bumped on invalidation, so an
+    answer computed against an older set of documents is never stored.
+
+    Entries are also tagged with a corpus version (the vector store's chunk
+    count) supplied by the caller. Ingestion runs in separate worker processes,
+    so a changed count is how the API notices that a document finished or
+    was removed.
+    """
+
+    def __init__(self, threshold: float, max_per_company: int, ttl: int):
+        self.threshold = threshold
+        self.max_per_company = max_per_company
+        self.ttl = ttl
+        self._entries = {}      # company_id -> list of (unit embedding, answer, sources, expires_at, corpus_version)
+        self._generations = {}  # company_id -> int
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def generation(self, company_id: int) -> int:
+        with self._lock:
+            return self._generations.get(company_id, 0)
+
+    def lookup(self, company_id: int, query_embedding, corpus_version):
+        """
+        Returns (answer, sources) for the most similar cached query above the
+        threshold, or None.
+        """
+        query = self._unit(query_embedding)
+        now = time.monotonic()
+
+        with self._lock:
+            entries = [
+                e for e in self._entries.get(company_id, [])
+                if e[3] > now and e[4] == corpus_version
+            ]
+            self._entries[company_id] = entries
+            if entries:
+                similarities = np.stack([e[0] for e in entries]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self.hits += 1
+                    _, answer, sources, _, _ = entries[best]
+                    return answer, list(sources)
+            self.misses += 1
+            return None
+
+    def store(self, company_id: int, query_embedding, answer: str, sources: list[str], generation: int, corpus_version):
+        """
+        Stores an answer unless the company's documents changed after `generation`
+        was read (i.e. the answer may be based on stale context).
+        """
+        with self._lock:
+            if self._generations.get(company_id, 0) != generation:
+                return
+            entries = self._entries.setdefault(company_id, [])
+            entries.append(
+                (self._unit(query_embedding), answer, tuple(sources), time.monotonic() + self.ttl, corpus_version)
+            )
+            if len(entries) > self.max_per_company:
+                del entries[: len(entries) - self.max_per_company]
+
+    def invalidate(self, company_id: int):
+        with self._lock:
+            self._entries.pop(company_id, None)
+            self._generations[company_id] = self._generations.get(company_id, 0) + 1
+        print(f"Answer cache invalidated for company_id: {company_id}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "companies": len(self._entries),
+                "entries": sum(len(e) for e in self._entries.values()),
+                "similarity_threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+answer_cache = SemanticAnswerCache(
+    threshold=ANSWER_CACHE_SIMILARITY,
+    max_per_company=ANSWER_CACHE_MAX_PER_COMPANY,
+    ttl=ANSWER_CACHE_TTL,
+)
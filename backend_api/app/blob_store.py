@@ -0,0 +1,174 @@
+# backend_api/app/blob_store.py
+#
+# Content-addressed file storage on the local filesystem. A blob lives at
+# <BLOB_STORE_DIR>/<hash[:2]>/<hash[2:4]>/<sha256>, so identical uploads are
+# stored once and document rows only keep the hash and size.
+#
+# Because blobs are shared, storing one and deleting one are serialized with a
+# transaction-scoped advisory lock on the hash: a writer given a session holds
+# the lock from just before the blob is put in place until it commits the row that
+# references it, and delete_if_unreferenced checks for references under the
+# same lock. Otherwise an upload could find the blob present, drop its own
+# copy, and have the blob removed by a delete that ran before its row existed.
+# Writers commit that row right away, before any slow work, so the lock is
+# only ever held briefly.
+
+import os
+import hashlib
+import tempfile
+from dotenv import load_dotenv
+from sqlalchemy import or_, text
+
+load_dotenv()
+
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "blob_store")
+# Uploads larger than this are rejected while streaming (default 100 MB)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+class BlobTooLarge(Exception):
+    def __init__(self, max_size: int):
+        super().__init__(f"File exceeds the maximum size of {max_size} bytes.")
+        self.max_size = max_size
+
+
+def blob_path(content_hash: str) -> str:
+    return os.path.join(BLOB_STORE_DIR, content_hash[:2], content_hash[2:4], content_hash)
+
+
+def exists(content_hash: str) -> bool:
+    return bool(content_hash) and os.path.exists(blob_path(content_hash))
+
+
+def lock(db, content_hash: str):
+    """
+    Takes the advisory lock on `content_hash` in the session's transaction;
+    it is released when the session commits or rolls back.
+    """
+    # First 63 bits of the hash, to fit Postgres' signed bigint key
+    db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": int(content_hash[:16], 16) >> 1})
+
+
+def _commit_temp_file(temp_path: str, content_hash: str, db=None):
+    """
+    Moves a fully written temp file into its content address. os.replace is
+    atomic, so readers never see a partially written blob. With a session,
+    the blob's lock is taken first and held until the caller commits.
+    """
+    if db is not None:
+        lock(db, content_hash)
+    final_path = blob_path(content_hash)
+    if os.path.exists(final_path):
+        os.remove(temp_path)
+        return
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    os.replace(temp_path, final_path)
+
+
+def put_bytes(data: bytes, db=None) -> tuple[str, int]:
+    """
+    Stores `data` and returns (sha256 hex digest, size in bytes). Pass the
+    session that will reference the blob as `db` (see the module comment).
+    """
+    content_hash = hashlib.sha256(data).hexdigest()
+    if db is not None:
+        lock(db, content_hash)
+    if not exists(content_hash):
+        os.makedirs(BLOB_STORE_DIR, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=BLOB_STORE_DIR, prefix=".incoming-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        _commit_temp_file(temp_path, content_hash)
+    return content_hash, len(data)
+
+
+class BlobWriter:
+    """
+    Writes a blob incrementally into a temp file inside the store, hashing
+    and counting bytes as they arrive. commit() moves the file to its content
+    address; abort() discards it. Used for sources that are not file-like,
+    such as async HTTP bodies.
+    """
+
+    def __init__(self, max_size: int = MAX_UPLOAD_BYTES):
+        os.makedirs(BLOB_STORE_DIR, exist_ok=True)
+        fd, self._temp_path = tempfile.mkstemp(dir=BLOB_STORE_DIR, prefix=".incoming-")
+        self._file = os.fdopen(fd, "wb")
+        self._digest = hashlib.sha256()
+        self.max_size = max_size
+        self.size = 0
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            raise BlobTooLarge(self.max_size)
+        self._digest.update(chunk)
+        self._file.write(chunk)
+
+    def commit(self, db=None) -> tuple[str | None, int]:
+        """
+        Returns (sha256 hex digest, size in bytes), or (None, 0) if nothing was
+        written. Pass the session that will reference the blob as `db`.
+        """
+        self._file.close()
+        if not self.size:
+            os.remove(self._temp_path)
+            return None, 0
+        content_hash = self._digest.hexdigest()
+        try:
+            _commit_temp_file(self._temp_path, content_hash, db)
+        except BaseException:
+            self.abort()
+            raise
+        return content_hash, self.size
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+
+def put_stream(fileobj, max_size: int = MAX_UPLOAD_BYTES, db=None) -> tuple[str | None, int]:
+    """
+    Copies a file-like object into the store chunk by chunk, hashing and
+    counting bytes in the same pass, so at most one chunk is held in memory.
+    Raises BlobTooLarge as soon as `max_size` is exceeded. Returns
+    (sha256 hex digest, size in bytes), or (None, 0) for an empty stream.
+    Pass the session that will reference the blob as `db`.
+    """
+    writer = BlobWriter(max_size)
+    try:
+        while chunk := fileobj.read(STREAM_CHUNK_SIZE):
+            writer.write(chunk)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.commit(db)
+
+
+def delete(content_hash: str):
+    try:
+        os.remove(blob_path(content_hash))
+    except FileNotFoundError:
+        pass
+
+
+def delete_if_unreferenced(db, content_hash: str | None):
+    """
+    Blobs are shared by identical uploads, so one is only removed once no
+    document points at it any more (as its content or as a refresh still
+    being ingested). Call after the referencing change is committed; commits
+    the session to release the blob's lock.
+    """
+    from . import models
+
+    if not content_hash:
+        return
+    lock(db, content_hash)
+    referenced = db.query(models.Document.id).filter(
+        or_(models.Document.content_hash == content_hash, models.Document.pending_content_hash == content_hash)
+    ).first()
+    if not referenced:
+        delete(content_hash)
+    db.commit()
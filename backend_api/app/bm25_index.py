@@ -0,0 +1,180 @@
+# backend_api/app/bm25_index.py
+#
+# Local per-company keyword index used next to the vector store for hybrid
+# retrieval. Each company has its own SQLite database with an FTS5 inverted
+# index over chunk text, ranked with BM25. SQLite in WAL mode lets the
+# ingestion workers write while API processes read.
+#
+# To backfill chunks that were ingested before the index existed:
+#
+#     python -m app.bm25_index --rebuild
+
+import os
+import re
+import sqlite3
+import argparse
+from contextlib import closing
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BM25_INDEX_DIR = os.getenv("BM25_INDEX_DIR", "bm25_index")
+
+# "-" and "_" are part of a token so identifiers like "POL-2024_07" or "AB-1234" stay whole
+_TOKEN_RE = re.compile(r"[\w\-]+", re.UNICODE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    rowid INTEGER PRIMARY KEY,
+    chunk_id TEXT UNIQUE NOT NULL,
+    document_id INTEGER NOT NULL,
+    filename TEXT,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_document ON chunks(document_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+    text, content='chunks', content_rowid='rowid', tokenize="unicode61 tokenchars '-_'"
+);
+CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN
+    INSERT INTO chunks_fts(rowid, text) VALUES (new.rowid, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN
+    INSERT INTO chunks_fts(chunks_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+END;
+"""
+
+_initialized = set()
+
+
+def _index_path(company_id: int) -> str:
+    return os.path.join(BM25_INDEX_DIR, f"company_{company_id}.sqlite3")
+
+
+def _connect(company_id: int) -> sqlite3.Connection:
+    os.makedirs(BM25_INDEX_DIR, exist_ok=True)
+    conn = sqlite3.connect(_index_path(company_id), timeout=30)
+    if company_id not in _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _initialized.add(company_id)
+    return conn
+
+
+def add_chunks(company_id: int, chunks: list[tuple]):
+    """
+    Indexes (chunk_id, document_id, filename, text) rows, replacing any
+    existing rows with the same chunk_id.
+    """
+    if not chunks:
+        return
+    with closing(_connect(company_id)) as conn, conn:
+        conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(c[0],) for c in chunks])
+        conn.executemany(
+            "INSERT INTO chunks (chunk_id, document_id, filename, text) VALUES (?, ?, ?, ?)",
+            chunks,
+        )
+
+
+def delete_document(company_id: int, document_id: int):
+    with closing(_connect(company_id)) as conn, conn:
+        conn.execute("DELETE FROM chunks WHERE document_id = ?", (document_id,))
+
+
+def delete_chunks(company_id: int, chunk_ids: list[str]):
+    if not chunk_ids:
+        return
+    with closing(_connect(company_id)) as conn, conn:
+        conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(chunk_id,) for chunk_id in chunk_ids])
+
+
+def last_modified(company_id: int) -> int:
+    """
+    Latest write time (ns) of the company's index, including its WAL file.
+    Every chunk add or delete writes here, so it changes with the corpus.
+    """
+    path = _index_path(company_id)
+    mtimes = [os.stat(p).st_mtime_ns for p in (path, f"{path}-wal") if os.path.exists(p)]
+    return max(mtimes, default=0)
+
+
+def build_match_query(query: str) -> str:
+    """
+    Turns free text into an FTS5 query that ORs every distinct term, each one
+    quoted so punctuation in part numbers or IDs is not parsed as syntax.
+    """
+    terms = []
+    for term in _TOKEN_RE.findall(query.lower()):
+        term = term.strip("-")
+        if term and term not in terms:
+            terms.append(term)
+    return " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def search(company_id: int, query: str, limit: int) -> list[dict]:
+    """
+    Returns up to `limit` chunks ranked by BM25, best first.
+    """
+    match = build_match_query(query)
+    if not match or not os.path.exists(_index_path(company_id)):
+        return []
+    with closing(_connect(company_id)) as conn:
+        rows = conn.execute(
+            """
+            SELECT c.chunk_id, c.document_id, c.filename, c.text, bm25(chunks_fts) AS score
+            FROM chunks_fts JOIN chunks c ON c.rowid = chunks_fts.rowid
+            WHERE chunks_fts MATCH ?
+            ORDER BY score
+            LIMIT ?
+            """,
+            (match, limit),
+        ).fetchall()
+    return [
+        {"chunk_id": chunk_id, "document_id": document_id, "filename": filename, "text_chunk": text, "score": -score}
+        for chunk_id, document_id, filename, text, score in rows
+    ]
+
+
+def rebuild(batch_size: int = 500):
+    """
+    Re-indexes every company's chunks from the vector store.
+    """
+    from . import models
+    from .database import SessionLocal
+    from .vector_store import ChromaVectorStore, get_vector_store
+
+    store = get_vector_store()
+    if not isinstance(store, ChromaVectorStore):
+        print("Rebuild reads chunk text from Chroma collections; other backends are not supported.")
+        return
+
+    db = SessionLocal()
+    try:
+        company_ids = [company_id for (company_id,) in db.query(models.Company.id).all()]
+    finally:
+        db.close()
+
+    for company_id in company_ids:
+        collection = store.collection(company_id)
+        indexed = 0
+        offset = 0
+        while True:
+            page = collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+            if not page["ids"]:
+                break
+            offset += len(page["ids"])
+            add_chunks(company_id, [
+                (chunk_id, meta.get("document_id"), meta.get("filename"), meta.get("text_chunk", ""))
+                for chunk_id, meta in zip(page["ids"], page["metadatas"])
+            ])
+            indexed += len(page["ids"])
+        print(f"Indexed {indexed} chunks for company_id: {company_id}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the per-company BM25 keyword index.")
+    parser.add_argument("--rebuild", action="store_true", help="Re-index all chunks from the vector store.")
+    args = parser.parse_args()
+    if args.rebuild:
+        rebuild()
+    else:
+        parser.print_help()
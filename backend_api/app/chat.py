@@ -1,40 +1,19 @@
 # backend_api/app/chat.py
 
-from .processing import co, collection
+import asyncio
+from contextlib import aclosing
+from .processing import EMBED_MODEL, async_co
+from .vector_store import get_vector_store
+from . import bm25_index
+from .retrieval import retrieve_documents
+from .embedding_cache import query_embedding_cache
+from .answer_cache import answer_cache
+from .query_log import StageTimer, query_logger
+from . import metrics
 
-def get_chatbot_response(query: str, company_id: int):
-    """
-    Queries the vector database for context and gets a response from Cohere's chat model,
-    using the model's built-in RAG and citation features for accuracy.
-    (This is the non-streaming version)
-    """
-    print(f"Received query for company_id: {company_id}")
-
-    query_embedding = co.embed(
-        texts=[query], model="embed-english-v3.0", input_type="search_query"
-    ).embeddings
-
-    results = collection.query(
-        query_embeddings=query_embedding,
-        n_results=10,
-        where={"company_id": company_id},
-    )
+NO_CONTEXT_ANSWER = "I'm sorry, I couldn't find any relevant information in the provided documents to answer your question."
 
-    retrieved_metadata = results.get('metadatas', [[]])[0]
-    
-    if not retrieved_metadata:
-        return "I'm sorry, I couldn't find any relevant information in the provided documents to answer your question."
-
-    documents = [
-        {
-            "id": doc.get("chunk_id", f"doc_{i}"),
-            "text": doc.get("text_chunk", ""),
-            "filename": doc.get("filename", "Unknown Source")
-        }
-        for i, doc in enumerate(retrieved_metadata)
-    ]
-
-    preamble = """
+PREAMBLE = """
     You are an expert Q&A assistant. Your goal is to provide clear, well-structured, and helpful answers based on the provided documents.
     When you answer, you MUST adhere to the following rules:
     1.  Provide a concise summary of the answer first.
@@ -45,101 +24,259 @@ def get_chatbot_response(query: str, company_id: int):
     6.  If the documents do not contain the answer, clearly state that the information was not found.
     """
 
-    response = co.chat(
+# Size (in words) of the pieces a cached answer is replayed in on the stream endpoint
+REPLAY_CHUNK_WORDS = 8
+
+
+async def embed_query(query: str):
+    """
+    Returns the query embedding (as a one-element list, ready for a collection query),
+    served from the query-embedding cache when possible.
+    """
+    async def compute():
+        response = await async_co.embed(
+            texts=[query], model=EMBED_MODEL, input_type="search_query"
+        )
+        return response.embeddings[0]
+
+    embedding = await query_embedding_cache.aget_or_compute(query, EMBED_MODEL, compute)
+    return [embedding]
+
+
+async def corpus_version(company_id: int):
+    """
+    Cheap fingerprint of the company's corpus used to expire cached answers
+    when ingestion workers add, remove or replace chunks. The chunk count alone
+    misses refreshes that swap chunks one for one, so the keyword index's last
+    write time is part of it.
+    """
+    count = await asyncio.to_thread(get_vector_store().count, company_id)
+    return count, bm25_index.last_modified(company_id)
+
+
+def cited_filenames(citations, documents) -> set:
+    cited_sources = set()
+    for citation in citations:
+        for doc_id in citation.document_ids:
+            source_file = next((doc['filename'] for doc in documents if doc['id'] == doc_id), "Unknown Source")
+            cited_sources.add(source_file)
+    return cited_sources
+
+
+def token_counts(meta) -> tuple[int | None, int | None]:
+    """
+    (input, output) token counts from a Cohere response's meta, billed units
+    preferred; None where the response carries no counts.
+    """
+    units = getattr(meta, "billed_units", None) or getattr(meta, "tokens", None)
+    if units is None:
+        return None, None
+    input_tokens = getattr(units, "input_tokens", None)
+    output_tokens = getattr(units, "output_tokens", None)
+    return (
+        int(input_tokens) if input_tokens is not None else None,
+        int(output_tokens) if output_tokens is not None else None,
+    )
+
+
+def log_query(
+    endpoint: str, outcome: str, query: str, answer: str, company_id: int, user_id: int | None,
+    chunk_ids: list[str], timer: StageTimer, input_tokens: int | None = None, output_tokens: int | None = None,
+):
+    """
+    Records a finished chat request in the query log and the latency metrics.
+    """
+    query_logger.record(
+        query, answer, company_id, user_id, chunk_ids, timer, input_tokens, output_tokens,
+        answer_cache_hit=outcome == "cached",
+    )
+    metrics.observe_chat(endpoint, outcome, company_id, timer)
+
+
+def format_sources(sources) -> str:
+    if not sources:
+        return ""
+    return "\n\n**Sources:**\n" + "\n".join(f"- {source}" for source in sorted(sources))
+
+
+async def get_chatbot_response(query: str, company_id: int, user_id: int | None = None):
+    """
+    Queries the vector database for context and gets a response from Cohere's chat model,
+    using the model's built-in RAG and citation features for accuracy.
+    (This is the non-streaming version)
+
+    Returns {"answer": ..., "dropped_chunks": [...]}, where dropped_chunks lists the
+    retrieved chunks that were left out of the prompt and why.
+    """
+    print(f"Received query for company_id: {company_id}")
+    timer = StageTimer()
+    try:
+        return await _answer_query(query, company_id, user_id, timer)
+    except Exception:
+        metrics.observe_chat("query", "error", company_id, timer)
+        raise
+
+
+async def _answer_query(query: str, company_id: int, user_id: int | None, timer: StageTimer):
+    query_embedding = await embed_query(query)
+    timer.mark("embed")
+
+    version = await corpus_version(company_id)
+    cached = answer_cache.lookup(company_id, query_embedding[0], version)
+    timer.mark("cache_lookup")
+    if cached:
+        answer, sources = cached
+        answer += format_sources(sources)
+        log_query("query", "cached", query, answer, company_id, user_id, [], timer)
+        return {"answer": answer, "dropped_chunks": []}
+
+    generation = answer_cache.generation(company_id)
+    documents, dropped_chunks = await retrieve_documents(query, query_embedding, company_id)
+    timer.mark("retrieve")
+    chunk_ids = [doc["id"] for doc in documents]
+
+    if not documents:
+        log_query("query", "no_context", query, NO_CONTEXT_ANSWER, company_id, user_id, chunk_ids, timer)
+        return {"answer": NO_CONTEXT_ANSWER, "dropped_chunks": dropped_chunks}
+
+    response = await async_co.chat(
         model="command-r-08-2024",
         message=query,
         documents=documents,
-        preamble=preamble,
+        preamble=PREAMBLE,
         prompt_truncation="AUTO",
         citation_quality="accurate"
     )
 
+    timer.mark("generate")
+
     answer = response.text
-    
-    if response.citations:
-        cited_sources = set()
-        for citation in response.citations:
-            for doc_id in citation.document_ids:
-                source_file = next((doc['filename'] for doc in documents if doc['id'] == doc_id), "Unknown Source")
-                cited_sources.add(source_file)
-        
-        if cited_sources:
-            answer += "\n\n**Sources:**\n" + "\n".join(f"- {source}" for source in sorted(list(cited_sources)))
+    sources = sorted(cited_filenames(response.citations or [], documents))
+    answer_cache.store(company_id, query_embedding[0], answer, sources, generation, version)
 
-    return answer
+    answer += format_sources(sources)
+    input_tokens, output_tokens = token_counts(response.meta)
+    log_query(
+        "query", "answered", query, answer, company_id, user_id, chunk_ids, timer, input_tokens, output_tokens
+    )
+    return {"answer": answer, "dropped_chunks": dropped_chunks}
 
 
-def get_chatbot_response_stream(query: str, company_id: int):
+def replay_cached_answer(answer: str, sources: list[str]):
+    """
+    Streams a cached answer back in small pieces so clients see the same
+    incremental output as for a live generation.
+    """
+    words = answer.split(" ")
+    for i in range(0, len(words), REPLAY_CHUNK_WORDS):
+        piece = " ".join(words[i:i + REPLAY_CHUNK_WORDS])
+        yield piece if i + REPLAY_CHUNK_WORDS >= len(words) else piece + " "
+    if sources:
+        yield format_sources(sources)
+
+
+async def get_chatbot_response_stream(query: str, company_id: int, user_id: int | None = None):
     """
     Queries the vector database for context and gets a streaming response from Cohere.
-    (This is the new streaming version)
+    (This is the new streaming version, an async generator for StreamingResponse)
     """
     print(f"Received query for company_id: {company_id}")
+    timer = StageTimer()
+    metrics.CHAT_STREAMS_IN_FLIGHT.inc()
+    try:
+        # aclosing: a client disconnect closes the inner generator right away, so it logs the partial answer
+        async with aclosing(_stream_answer(query, company_id, user_id, timer)) as pieces:
+            async for piece in pieces:
+                yield piece
+    except Exception:
+        metrics.observe_chat("query_stream", "error", company_id, timer)
+        raise
+    finally:
+        metrics.CHAT_STREAMS_IN_FLIGHT.dec()
 
-    query_embedding = co.embed(
-        texts=[query], model="embed-english-v3.0", input_type="search_query"
-    ).embeddings
 
-    results = collection.query(
-        query_embeddings=query_embedding,
-        n_results=10,
-        where={"company_id": company_id},
-    )
+async def _stream_answer(query: str, company_id: int, user_id: int | None, timer: StageTimer):
+    query_embedding = await embed_query(query)
+    timer.mark("embed")
 
-    retrieved_metadata = results.get('metadatas', [[]])[0]
-    
-    if not retrieved_metadata:
-        yield "I'm sorry, I couldn't find any relevant information in the provided documents to answer your question."
+    version = await corpus_version(company_id)
+    cached = answer_cache.lookup(company_id, query_embedding[0], version)
+    timer.mark("cache_lookup")
+    if cached:
+        pieces = list(replay_cached_answer(*cached))
+        log_query("query_stream", "cached", query, "".join(pieces), company_id, user_id, [], timer)
+        for piece in pieces:
+            yield piece
         return
 
-    documents = [
-        {
-            "id": doc.get("chunk_id", f"doc_{i}"),
-            "text": doc.get("text_chunk", ""),
-            "filename": doc.get("filename", "Unknown Source")
-        }
-        for i, doc in enumerate(retrieved_metadata)
-    ]
+    generation = answer_cache.generation(company_id)
+    # Dropped chunks are logged by retrieve_documents; the stream carries only answer text
+    documents, _ = await retrieve_documents(query, query_embedding, company_id)
+    timer.mark("retrieve")
+    chunk_ids = [doc["id"] for doc in documents]
 
-    preamble = """
-    You are an expert Q&A assistant. Your goal is to provide clear, well-structured, and helpful answers based on the provided documents.
-    When you answer, you MUST adhere to the following rules:
-    1.  Provide a concise summary of the answer first.
-    2.  Use markdown formatting, such as bullet points and bolding, to structure the detailed information for readability.
-    3.  Synthesize information from all relevant sources to provide a comprehensive answer.
-    4.  Do NOT make up information. Only use the information present in the provided documents.
-    5.  You MUST cite your sources accurately for each piece of information.
-    6.  If the documents do not contain the answer, clearly state that the information was not found.
-    """
+    if not documents:
+        log_query("query_stream", "no_context", query, NO_CONTEXT_ANSWER, company_id, user_id, chunk_ids, timer)
+        yield NO_CONTEXT_ANSWER
+        return
 
-    response_stream = co.chat_stream(
+    response_stream = async_co.chat_stream(
         model="command-r-08-2024",
         message=query,
         documents=documents,
-        preamble=preamble,
+        preamble=PREAMBLE,
         prompt_truncation="AUTO",
         citation_quality="accurate"
     )
 
     cited_sources = set()
+    answer_parts = []
+    completed = False
+    input_tokens = output_tokens = None
+    failed = False
+
+    try:
+        # Iterate over the Cohere response stream
+        async for event in response_stream:
+            # Check for text chunks and yield them to the client
+            if event.event_type == "text-generation":
+                # "first_token" is the wait for Cohere's first token; "generate" is the rest
+                if not answer_parts:
+                    timer.mark("first_token")
+                answer_parts.append(event.text)
+                yield event.text
+
+            # Collect citations as they arrive
+            elif event.event_type == "citation-generation":
+                cited_sources |= cited_filenames(event.citations, documents)
+
+            # Stop iteration when the stream ends
+            elif event.event_type == "stream-end":
+                completed = True
+                input_tokens, output_tokens = token_counts(getattr(event.response, "meta", None))
+                break
+
+        sources = sorted(cited_sources)
+
+        # Only complete generations are worth replaying later
+        if completed:
+            answer_cache.store(
+                company_id, query_embedding[0], "".join(answer_parts), sources, generation, version
+            )
 
-    # Iterate over the Cohere response stream
-    for event in response_stream:
-        # Check for text chunks and yield them to the client
-        if event.event_type == "text-generation":
-            yield event.text
-        
-        # Collect citations as they arrive
-        elif event.event_type == "citation-generation":
-            for citation in event.citations:
-                for doc_id in citation.document_ids:
-                    source_file = next((doc['filename'] for doc in documents if doc['id'] == doc_id), "Unknown Source")
-                    cited_sources.add(source_file)
-        
-        # Stop iteration when the stream ends
-        elif event.event_type == "stream-end":
-            break
-
-    # After the text has been streamed, yield the sources
-    if cited_sources:
-        yield "\n\n**Sources:**\n" + "\n".join(f"- {source}" for source in sorted(list(cited_sources)))
\ No newline at end of file
+        # After the text has been streamed, yield the sources
+        if sources:
+            answer_parts.append(format_sources(sources))
+            yield answer_parts[-1]
+    except Exception:
+        # Counted as an error by get_chatbot_response_stream
+        failed = True
+        raise
+    finally:
+        # Also reached when the client disconnects mid-answer; the partial answer is logged
+        if not failed:
+            timer.mark("generate")
+            log_query(
+                "query_stream", "answered" if completed else "aborted", query, "".join(answer_parts),
+                company_id, user_id, chunk_ids, timer, input_tokens, output_tokens,
+            )
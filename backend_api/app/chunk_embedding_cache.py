@@ -0,0 +1,80 @@
+# backend_api/app/chunk_embedding_cache.py
+
+import hashlib
+import numpy as np
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from . import models
+from .embed_batcher import embedding_batcher
+
+
+def chunk_hash(text: str, model: str, input_type: str) -> str:
+    """
+    Content address of a chunk embedding: identical text embedded with the
+    same model and input_type always maps to the same key.
+    """
+    return hashlib.sha256(f"{model}\x00{input_type}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def _encode(embedding) -> bytes:
+    return np.asarray(embedding, dtype="<f4").tobytes()
+
+
+def _decode(data: bytes) -> list[float]:
+    return np.frombuffer(data, dtype="<f4").tolist()
+
+
+def lookup(db: Session, hashes: list[str]) -> dict:
+    """
+    Fetches every cached embedding among `hashes` in a single query.
+    """
+    if not hashes:
+        return {}
+    rows = (
+        db.query(models.ChunkEmbedding.content_hash, models.ChunkEmbedding.embedding)
+        .filter(models.ChunkEmbedding.content_hash.in_(hashes))
+        .all()
+    )
+    return {content_hash: _decode(embedding) for content_hash, embedding in rows}
+
+
+def store(db: Session, model: str, input_type: str, embeddings_by_hash: dict):
+    if not embeddings_by_hash:
+        return
+    rows = [
+        {
+            "content_hash": content_hash,
+            "model": model,
+            "input_type": input_type,
+            "dimensions": len(embedding),
+            "embedding": _encode(embedding),
+        }
+        for content_hash, embedding in embeddings_by_hash.items()
+    ]
+    # Concurrent jobs may embed the same chunk; whichever commits first wins
+    db.execute(insert(models.ChunkEmbedding).values(rows).on_conflict_do_nothing(index_elements=["content_hash"]))
+    db.commit()
+
+
+def embed_with_cache(db: Session, texts: list[str], model: str, input_type: str):
+    """
+    Returns (embeddings in the order of `texts`, reused count, freshly embedded count).
+    Only texts whose hash is not cached are sent to the embedding batcher.
+    """
+    hashes = [chunk_hash(text, model, input_type) for text in texts]
+    cached = lookup(db, list(set(hashes)))
+
+    missing = {}
+    for content_hash, text in zip(hashes, texts):
+        if content_hash not in cached:
+            missing.setdefault(content_hash, text)
+
+    fresh = {}
+    if missing:
+        embeddings = embedding_batcher.embed(list(missing.values()), model=model, input_type=input_type)
+        fresh = dict(zip(missing.keys(), embeddings))
+        store(db, model, input_type, fresh)
+
+    embeddings = [cached[h] if h in cached else fresh[h] for h in hashes]
+    reused = sum(1 for h in hashes if h in cached)
+    return embeddings, reused, len(hashes) - reused
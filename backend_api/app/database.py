@@ -1,19 +1,136 @@
 # # backend_api/app/database.py
 
 import os
+import time
+import threading
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 
 # --- Database URL ---
 # This is the connection string for your PostgreSQL database.
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# --- Connection pool settings ---
+# Every process (API server, each ingestion worker) has its own pool, so the
+# database sees up to (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections per process.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Seconds to wait for a free connection before giving up
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Connections older than this are replaced, before the server or a proxy drops them
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Server-side limit for a single statement; 0 disables it
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+
+class PoolStats:
+    """
+    Counters for pool_metrics(), updated by the pool and its events.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+        self.connections_opened = 0
+        self.invalidated = 0
+        self.overflow_peak = 0
+
+    def record_wait(self, seconds: float, overflow: int):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            self.overflow_peak = max(self.overflow_peak, overflow)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def increment(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "overflow_peak": self.overflow_peak,
+                "checkouts": self.checkouts,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_avg": round(self.wait_seconds_total / self.checkouts, 6) if self.checkouts else 0.0,
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+                "timeouts": self.timeouts,
+                "connections_opened": self.connections_opened,
+                "invalidated": self.invalidated,
+            }
+
+
+pool_stats = PoolStats()
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that measures how long each checkout waited for a connection,
+    including the time spent opening a new one.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_stats.record_timeout()
+            raise
+        pool_stats.record_wait(time.perf_counter() - start, max(self.overflow(), 0))
+        return connection
+
+
+def _engine_options(url: str) -> dict:
+    options = {
+        "poolclass": TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if DB_STATEMENT_TIMEOUT_MS and make_url(url).get_backend_name() == "postgresql":
+        options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
+
 # --- SQLAlchemy Engine ---
 # The engine is the central point of communication with the database.
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+
+event.listen(engine.pool, "connect", lambda *args: pool_stats.increment("connections_opened"))
+event.listen(engine.pool, "invalidate", lambda *args: pool_stats.increment("invalidated"))
+
+
+def pool_metrics() -> dict:
+    """
+    Live state of this process's connection pool plus the counters collected
+    since it started; used to size DB_POOL_SIZE / DB_MAX_OVERFLOW per process.
+    """
+    pool = engine.pool
+    return {
+        "pool_size": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        # The pool reports a negative overflow until pool_size connections are open
+        "overflow": max(pool.overflow(), 0),
+        **pool_stats.snapshot(),
+    }
 
 
 # --- Database Session ---
@@ -21,6 +138,18 @@ engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def get_db():
+    """
+    FastAPI dependency: one session per request, always closed afterwards so
+    its connection goes back to the pool.
+    """
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
 # --- Declarative Base ---
 # Our ORM models will inherit from this class to be registered with SQLAlchemy.
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
@@ -0,0 +1,130 @@
+# backend_api/app/embed_batcher.py
+
+import os
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Configuration ---
+# Cohere accepts at most 96 texts per embed call.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "96"))
+# How long a partially filled batch may wait for more texts before it is sent anyway.
+EMBED_BATCH_MAX_WAIT_MS = int(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "50"))
+EMBED_MAX_CONCURRENT_CALLS = int(os.getenv("EMBED_MAX_CONCURRENT_CALLS", "4"))
+
+
+class EmbeddingBatcher:
+    """
+    Collects texts from every ingestion job running in this process and sends
+    them to the embedding provider in full-size batches. A batch is flushed when
+    it reaches `batch_size` texts or its oldest text has waited `max_wait`
+    seconds; at most `max_concurrency` embed calls are in flight at once.
+    Each caller gets back exactly the embeddings for the texts it submitted.
+    """
+
+    def __init__(self, embed_fn, batch_size: int, max_wait: float, max_concurrency: int):
+        self._embed_fn = embed_fn  # (texts, model, input_type) -> list of embeddings
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._pending = {}  # (model, input_type) -> list of (text, future, enqueued_at)
+        self._cond = threading.Condition()
+        self._slots = threading.Semaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="embed")
+        self._dispatcher = None
+
+        self.calls = 0
+        self.texts = 0
+
+    def _ensure_started(self):
+        if self._dispatcher is None:
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name="embed-batcher", daemon=True)
+            self._dispatcher.start()
+
+    def submit(self, text: str, model: str, input_type: str) -> Future:
+        future = Future()
+        with self._cond:
+            self._ensure_started()
+            self._pending.setdefault((model, input_type), []).append((text, future, time.monotonic()))
+            self._cond.notify()
+        return future
+
+    def embed(self, texts: list[str], model: str, input_type: str) -> list:
+        """
+        Blocking helper: embeds `texts` through the shared batches and returns
+        their embeddings in order.
+        """
+        futures = [self.submit(text, model, input_type) for text in texts]
+        return [future.result() for future in futures]
+
+    def _take_ready_batch(self):
+        """
+        Waits until some queue holds a full batch or has waited long enough,
+        then removes and returns up to `batch_size` items from it.
+        """
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                next_deadline = None
+                for key, items in self._pending.items():
+                    if not items:
+                        continue
+                    deadline = items[0][2] + self.max_wait
+                    if len(items) >= self.batch_size or deadline <= now:
+                        batch = items[: self.batch_size]
+                        del items[: self.batch_size]
+                        return key, batch
+                    next_deadline = deadline if next_deadline is None else min(next_deadline, deadline)
+                timeout = None if next_deadline is None else next_deadline - now
+                self._cond.wait(timeout)
+
+    def _dispatch_loop(self):
+        while True:
+            # Waiting for a free slot first lets batches keep filling while all
+            # embed calls are busy.
+            self._slots.acquire()
+            key, batch = self._take_ready_batch()
+            self._executor.submit(self._run_batch, key, batch)
+
+    def _run_batch(self, key, batch):
+        model, input_type = key
+        try:
+            embeddings = self._embed_fn([text for text, _, _ in batch], model, input_type)
+            # zip() would leave the futures of missing embeddings unresolved, and their callers waiting forever
+            if len(embeddings) != len(batch):
+                raise ValueError(f"Embedding provider returned {len(embeddings)} embeddings for {len(batch)} texts.")
+            with self._cond:
+                self.calls += 1
+                self.texts += len(batch)
+            for (_, future, _), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._slots.release()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "embed_calls": self.calls,
+                "texts_embedded": self.texts,
+                "avg_batch_size": self.texts / self.calls if self.calls else 0.0,
+                "pending": sum(len(items) for items in self._pending.values()),
+            }
+
+
+def _cohere_embed(texts, model, input_type):
+    from .processing import co
+    return co.embed(texts=texts, model=model, input_type=input_type).embeddings
+
+
+embedding_batcher = EmbeddingBatcher(
+    embed_fn=_cohere_embed,
+    batch_size=EMBED_BATCH_SIZE,
+    max_wait=EMBED_BATCH_MAX_WAIT_MS / 1000,
+    max_concurrency=EMBED_MAX_CONCURRENT_CALLS,
+)
@@ -0,0 +1,178 @@
+# backend_api/app/embedding_cache.py
+
+import os
+import json
+import asyncio
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Configuration ---
+# Size and lifetime of the per-process cache. Setting QUERY_EMBED_CACHE_REDIS_URL
+# adds a shared Redis tier so every uvicorn worker can reuse the same entries.
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "2048"))
+QUERY_EMBED_CACHE_TTL = int(os.getenv("QUERY_EMBED_CACHE_TTL", "3600"))
+QUERY_EMBED_CACHE_REDIS_URL = os.getenv("QUERY_EMBED_CACHE_REDIS_URL")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes query text so that trivially different questions
+    ("What is X?" / "what is x") share a cache entry.
+    """
+    return " ".join(query.lower().split()).strip(" ?!.")
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU cache with TTL for query embeddings, keyed on normalized
+    query text + embedding model name. An optional Redis backend is used
+    as a second tier shared between processes.
+    """
+
+    def __init__(self, max_size: int, ttl: int, redis_url: str | None = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._miss_seconds = 0.0
+
+        if redis_url:
+            try:
+                import redis  # optional dependency, only needed for the shared tier
+                self._redis = redis.Redis.from_url(redis_url)
+                print(f"Query embedding cache using shared backend at {redis_url}")
+            except Exception as e:
+                print(f"Shared query embedding cache unavailable, using local cache only: {e}")
+
+    @staticmethod
+    def make_key(query: str, model: str) -> str:
+        digest = hashlib.sha256(f"{model}\x00{normalize_query(query)}".encode("utf-8")).hexdigest()
+        return f"qembed:{digest}"
+
+    def get(self, query: str, model: str):
+        key = self.make_key(query, model)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, embedding = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return embedding
+                del self._entries[key]
+
+        if self._redis is not None:
+            try:
+                raw = self._redis.get(key)
+            except Exception as e:
+                print(f"Shared query embedding cache read failed: {e}")
+                raw = None
+            if raw is not None:
+                embedding = json.loads(raw)
+                self._store_local(key, embedding)
+                with self._lock:
+                    self.hits += 1
+                    self.shared_hits += 1
+                return embedding
+
+        return None
+
+    def set(self, query: str, model: str, embedding: list[float]):
+        key = self.make_key(query, model)
+        self._store_local(key, embedding)
+        if self._redis is not None:
+            try:
+                self._redis.set(key, json.dumps(embedding), ex=self.ttl)
+            except Exception as e:
+                print(f"Shared query embedding cache write failed: {e}")
+
+    def get_or_compute(self, query: str, model: str, compute):
+        """
+        Returns the cached embedding for `query`, calling `compute()` on a miss.
+        Miss latency is recorded so stats() can estimate the time saved by hits.
+        """
+        embedding = self.get(query, model)
+        if embedding is not None:
+            return embedding
+
+        start = time.perf_counter()
+        embedding = compute()
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.misses += 1
+            self._miss_seconds += elapsed
+        self.set(query, model, embedding)
+        return embedding
+
+    async def aget_or_compute(self, query: str, model: str, compute):
+        """
+        Async variant of get_or_compute for the event loop: `compute` is a
+        coroutine function, and the Redis tier (a blocking client) is
+        consulted from a worker thread.
+        """
+        if self._redis is not None:
+            embedding = await asyncio.to_thread(self.get, query, model)
+        else:
+            embedding = self.get(query, model)
+        if embedding is not None:
+            return embedding
+
+        start = time.perf_counter()
+        embedding = await compute()
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.misses += 1
+            self._miss_seconds += elapsed
+
+        if self._redis is not None:
+            await asyncio.to_thread(self.set, query, model, embedding)
+        else:
+            self.set(query, model, embedding)
+        return embedding
+
+    def _store_local(self, key: str, embedding: list[float]):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            avg_miss = self._miss_seconds / self.misses if self.misses else 0.0
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "shared_backend": self._redis is not None,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "avg_embed_seconds": avg_miss,
+                "estimated_seconds_saved": self.hits * avg_miss,
+            }
+
+
+query_embedding_cache = QueryEmbeddingCache(
+    max_size=QUERY_EMBED_CACHE_SIZE,
+    ttl=QUERY_EMBED_CACHE_TTL,
+    redis_url=QUERY_EMBED_CACHE_REDIS_URL,
+)
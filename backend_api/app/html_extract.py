@@ -0,0 +1,133 @@
+# backend_api/app/html_extract.py
+#
+# HTML to text for ingestion. In "main" mode only the page's main content is
+# kept: scripts, navigation, headers, footers, sidebars and cookie/share/
+# newsletter blocks are removed before text extraction, so they are never
+# chunked, embedded or retrieved. Headings are kept as markdown-style lines
+# starting a new paragraph, so the chunker prefers to split at section starts.
+
+import os
+import re
+from dataclasses import dataclass
+from bs4 import BeautifulSoup
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "main" drops boilerplate, "full" keeps all visible text (the previous behaviour)
+HTML_EXTRACTION_MODE = os.getenv("HTML_EXTRACTION_MODE", "main").lower()
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+# Never content, whatever the mode
+_NON_TEXT_TAGS = ["script", "style", "noscript", "template", "svg", "canvas", "iframe", "object"]
+# Page chrome around the main content
+_BOILERPLATE_TAGS = ["nav", "aside", "button", "dialog"]
+# Inside <main>/<article> these are the article's own header and footer, so they
+# are only removed when the page has no main-content element
+_PAGE_CHROME_TAGS = ["header", "footer"]
+_BOILERPLATE_ROLES = {"navigation", "banner", "contentinfo", "complementary", "search", "dialog", "alert"}
+# Matched against each class name / id, split on "-" and "_"
+_BOILERPLATE_NAME = re.compile(
+    r"(^|[-_])(cookies?|consent|gdpr|breadcrumbs?|sidebar|menu|navbar|nav|footer|share|sharing|social"
+    r"|newsletter|subscribe|advert|ads?|promo|popup|modal|banner|skip-link)([-_]|$)",
+    re.IGNORECASE,
+)
+_HEADING_TAGS = ["h1", "h2", "h3", "h4", "h5", "h6"]
+# Class names like "has-sidebar" or "nav-open" also sit on wrappers around the
+# whole page, and ASP.NET pages wrap the body in one <form>. An element holding
+# this share of the content root's text is never removed as boilerplate.
+_MAX_BOILERPLATE_SHARE = 0.5
+# When less than this share of the page's text survives, extraction has most
+# likely removed content, so the full text is used instead
+_MIN_KEPT_SHARE = 0.1
+# Marks heading lines while BeautifulSoup joins the text
+_HEADING_MARK = "\x00"
+
+
+@dataclass
+class HtmlExtraction:
+    text: str
+    # Characters of visible text on the whole page; only set in "main" mode, for comparison
+    full_length: int | None = None
+
+
+def _is_boilerplate(tag) -> bool:
+    if tag.attrs is None:
+        return False
+    if tag.get("role") in _BOILERPLATE_ROLES or tag.get("aria-hidden") == "true":
+        return True
+    names = list(tag.get("class") or [])
+    if tag.get("id"):
+        names.append(tag["id"])
+    return any(_BOILERPLATE_NAME.search(name) for name in names)
+
+
+def _text_length(tag) -> int:
+    return len(tag.get_text("", strip=True))
+
+
+def _remove(tags, root_length: int, keep_headings: bool):
+    """
+    Decomposes the boilerplate candidates, except those holding most of the
+    root's text and, with keep_headings, those containing a heading.
+    """
+    for tag in tags:
+        if tag.decomposed:
+            continue
+        if root_length and _text_length(tag) > root_length * _MAX_BOILERPLATE_SHARE:
+            continue
+        if keep_headings and tag.find(_HEADING_TAGS):
+            continue
+        tag.decompose()
+
+
+def _mark_headings(root):
+    for heading in root.find_all(_HEADING_TAGS):
+        text = heading.get_text(" ", strip=True)
+        if text:
+            heading.string = f"{_HEADING_MARK}{'#' * int(heading.name[1])} {text}"
+        else:
+            heading.decompose()
+
+
+def _to_text(root) -> str:
+    lines = []
+    for line in root.get_text("\n", strip=True).split("\n"):
+        if line.startswith(_HEADING_MARK):
+            # Blank line before a heading: the splitter's first separator is "\n\n"
+            lines.extend(["", line[len(_HEADING_MARK):]])
+        else:
+            lines.append(line)
+    return "\n".join(lines).strip()
+
+
+def extract_html_text(content: bytes | str, mode: str = HTML_EXTRACTION_MODE) -> HtmlExtraction:
+    soup = BeautifulSoup(content, HTML_PARSER)
+    for tag in soup(_NON_TEXT_TAGS):
+        tag.decompose()
+
+    if mode != "main":
+        return HtmlExtraction(text=soup.get_text(separator="\n", strip=True))
+
+    full_text = soup.get_text(separator="\n", strip=True)
+
+    root = soup.find("main") or soup.find(attrs={"role": "main"}) or soup.find("article")
+    if root is None:
+        root = soup.body or soup
+        _remove(root.find_all(_PAGE_CHROME_TAGS), _text_length(root), keep_headings=False)
+    root_length = _text_length(root)
+    _remove(root.find_all(_BOILERPLATE_TAGS), root_length, keep_headings=False)
+    # Forms and class/id matches are guesses, so they are kept when they contain a heading
+    _remove(root.find_all("form"), root_length, keep_headings=True)
+    _remove([tag for tag in root.find_all(True) if _is_boilerplate(tag)], root_length, keep_headings=True)
+    _mark_headings(root)
+
+    text = _to_text(root)
+    if len(text) < len(full_text) * _MIN_KEPT_SHARE:
+        text = full_text
+    return HtmlExtraction(text=text, full_length=len(full_text))
@@ -0,0 +1,34 @@
+# backend_api/app/http_cache.py
+#
+# Conditional GET support for API responses. Clients send back the ETag they
+# got with If-None-Match and receive an empty 304 while nothing has changed.
+
+import json
+import hashlib
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Weak comparison as required for If-None-Match: W/ prefixes are ignored
+    and "*" matches any current representation.
+    """
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def json_response_with_etag(request: Request, payload) -> Response:
+    """
+    JSON response whose ETag is a hash of the serialized body, or a 304 when
+    the request's If-None-Match already names that body.
+    """
+    body = json.dumps(jsonable_encoder(payload), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    etag = f'W/"{hashlib.sha256(body).hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag.removeprefix("W/")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
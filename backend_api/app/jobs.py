@@ -0,0 +1,220 @@
+# backend_api/app/jobs.py
+
+import os
+import random
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from sqlalchemy import and_, or_, func, text
+from sqlalchemy.orm import Session
+from . import models
+
+load_dotenv()
+
+# --- Retry / locking configuration ---
+INGEST_JOB_MAX_ATTEMPTS = int(os.getenv("INGEST_JOB_MAX_ATTEMPTS", "5"))
+INGEST_RETRY_BASE_SECONDS = float(os.getenv("INGEST_RETRY_BASE_SECONDS", "10"))
+INGEST_RETRY_MAX_SECONDS = float(os.getenv("INGEST_RETRY_MAX_SECONDS", "900"))
+# Workers bump locked_at of their running jobs every INGEST_JOB_HEARTBEAT_SECONDS.
+# A running job without a heartbeat for INGEST_JOB_LOCK_TIMEOUT is assumed to
+# belong to a crashed worker and becomes claimable again.
+INGEST_JOB_HEARTBEAT_SECONDS = float(os.getenv("INGEST_JOB_HEARTBEAT_SECONDS", "60"))
+INGEST_JOB_LOCK_TIMEOUT = int(os.getenv("INGEST_JOB_LOCK_TIMEOUT", "600"))
+# Arbitrary constant identifying the refresh scheduler's advisory lock
+REFRESH_SCHEDULER_LOCK_KEY = 7261001
+
+
+JOB_KIND_INGEST = "ingest"
+JOB_KIND_REFRESH = "refresh"
+
+# Document.ingestion_stage values of documents with ingestion work still ahead
+IN_FLIGHT_STAGES = ("queued", "extracting", "embedding", "retrying")
+
+
+def enqueue_ingestion_job(db: Session, document: models.Document, kind: str = JOB_KIND_INGEST) -> models.IngestionJob:
+    """
+    Adds an ingestion job for `document` to the session. The caller commits,
+    so the document row and its job are persisted in the same transaction.
+    """
+    document.ingestion_stage = "queued"
+    job = models.IngestionJob(
+        document=document,
+        company_id=document.company_id,
+        kind=kind,
+        status=models.JobStatusEnum.queued,
+        max_attempts=INGEST_JOB_MAX_ATTEMPTS,
+        run_after=datetime.utcnow(),
+    )
+    db.add(job)
+    return job
+
+
+def has_pending_job(db: Session, document_id: int) -> bool:
+    return db.query(models.IngestionJob.id).filter(
+        models.IngestionJob.document_id == document_id,
+        models.IngestionJob.status.in_([models.JobStatusEnum.queued, models.JobStatusEnum.running]),
+    ).first() is not None
+
+
+def enqueue_due_refreshes(db: Session, interval_seconds: float) -> int:
+    """
+    Queues refresh jobs for URL documents not refreshed within `interval_seconds`
+    that have no job pending. A transaction-scoped advisory lock keeps several
+    worker hosts from scheduling the same refreshes. Returns the number queued.
+    """
+    if not db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": REFRESH_SCHEDULER_LOCK_KEY}).scalar():
+        db.rollback()
+        return 0
+
+    due_before = datetime.utcnow() - timedelta(seconds=interval_seconds)
+    pending = (
+        db.query(models.IngestionJob.document_id)
+        .filter(models.IngestionJob.status.in_([models.JobStatusEnum.queued, models.JobStatusEnum.running]))
+    )
+    documents = (
+        db.query(models.Document)
+        .filter(
+            models.Document.source_url.isnot(None),
+            models.Document.status != models.StatusEnum.failed,
+            func.coalesce(models.Document.last_refreshed_at, models.Document.uploaded_at) < due_before,
+            models.Document.id.notin_(pending),
+        )
+        .all()
+    )
+    for document in documents:
+        enqueue_ingestion_job(db, document, kind=JOB_KIND_REFRESH)
+    db.commit()
+    return len(documents)
+
+
+def fail_stale_exhausted_jobs(db: Session) -> int:
+    """
+    Fails running jobs whose worker stopped sending heartbeats and that have no
+    attempts left. A document that crashes its worker (e.g. out of memory)
+    never reaches mark_job_failed, and would otherwise be reclaimed forever.
+    """
+    stale_before = datetime.utcnow() - timedelta(seconds=INGEST_JOB_LOCK_TIMEOUT)
+    jobs = (
+        db.query(models.IngestionJob)
+        .filter(
+            models.IngestionJob.status == models.JobStatusEnum.running,
+            models.IngestionJob.locked_at < stale_before,
+            models.IngestionJob.attempts >= models.IngestionJob.max_attempts,
+        )
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    for job in jobs:
+        _record_failure(job, f"Worker {job.locked_by} stopped responding while running this job (it may have crashed).")
+    db.commit()
+    return len(jobs)
+
+
+def touch_job(db: Session, job_id: int, worker_id: str) -> bool:
+    """
+    Heartbeat: refreshes locked_at of a job this worker is still running, so
+    it is not mistaken for the job of a crashed worker.
+    """
+    updated = (
+        db.query(models.IngestionJob)
+        .filter(
+            models.IngestionJob.id == job_id,
+            models.IngestionJob.locked_by == worker_id,
+            models.IngestionJob.status == models.JobStatusEnum.running,
+        )
+        .update({"locked_at": datetime.utcnow()}, synchronize_session=False)
+    )
+    db.commit()
+    return bool(updated)
+
+
+def claim_next_job(db: Session, worker_id: str):
+    """
+    Atomically claims the next runnable job using SELECT ... FOR UPDATE SKIP LOCKED,
+    so concurrent workers never pick up the same job. Stale running jobs are
+    reclaimed only while they have attempts left.
+    """
+    fail_stale_exhausted_jobs(db)
+
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=INGEST_JOB_LOCK_TIMEOUT)
+
+    job = (
+        db.query(models.IngestionJob)
+        .filter(
+            or_(
+                and_(
+                    models.IngestionJob.status == models.JobStatusEnum.queued,
+                    models.IngestionJob.run_after <= now,
+                ),
+                and_(
+                    models.IngestionJob.status == models.JobStatusEnum.running,
+                    models.IngestionJob.locked_at < stale_before,
+                    models.IngestionJob.attempts < models.IngestionJob.max_attempts,
+                ),
+            )
+        )
+        .order_by(models.IngestionJob.run_after, models.IngestionJob.id)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if not job:
+        db.commit()
+        return None
+
+    job.status = models.JobStatusEnum.running
+    job.attempts = (job.attempts or 0) + 1
+    job.locked_by = worker_id
+    job.locked_at = now
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def mark_job_succeeded(db: Session, job: models.IngestionJob):
+    job.status = models.JobStatusEnum.succeeded
+    job.locked_by = None
+    job.locked_at = None
+    job.last_error = None
+    db.commit()
+
+
+def retry_delay(attempts: int) -> float:
+    """
+    Exponential backoff with full jitter, capped at INGEST_RETRY_MAX_SECONDS.
+    """
+    ceiling = min(INGEST_RETRY_MAX_SECONDS, INGEST_RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0)))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+def mark_job_failed(db: Session, job: models.IngestionJob, error: str):
+    """
+    Records a failed attempt. The job is re-queued with backoff until it
+    runs out of attempts, after which it stays failed. The error is shown on
+    the document; a document whose ingestion finally failed is marked failed,
+    while a failed refresh leaves the previous content (and status) in place.
+    """
+    _record_failure(job, error)
+    db.commit()
+
+
+def _record_failure(job: models.IngestionJob, error: str):
+    job.last_error = error
+    job.locked_by = None
+    job.locked_at = None
+    final = job.attempts >= job.max_attempts
+    if final:
+        job.status = models.JobStatusEnum.failed
+    else:
+        job.status = models.JobStatusEnum.queued
+        job.run_after = datetime.utcnow() + timedelta(seconds=retry_delay(job.attempts))
+
+    document = job.document
+    if document is not None:
+        document.error_message = error
+        if not final:
+            document.ingestion_stage = "retrying"
+        elif job.kind == JOB_KIND_REFRESH:
+            document.ingestion_stage = "completed"
+        else:
+            document.status = models.StatusEnum.failed
+            document.ingestion_stage = "failed"
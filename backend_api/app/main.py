@@ -1,14 +1,33 @@
 # backend_api/app/main.py
 
-from fastapi import FastAPI
-from . import models
-from .database import engine
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from . import models, metrics
+from .database import engine, pool_metrics
+from .schema_upgrades import upgrade_schema
+from .url_batches import watch_unfinished_batches
+from .url_fetcher import close_client
+from .query_log import query_logger
 # Import the new chat router
 from .routers import auth, documents, chat, companies
 
 models.Base.metadata.create_all(bind=engine)
+upgrade_schema(engine)
 
-app = FastAPI(title="Company Chatbot API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    query_logger.start()
+    batch_watcher = asyncio.create_task(watch_unfinished_batches())
+    yield
+    batch_watcher.cancel()
+    await close_client()
+    # Write out chat queries still waiting in the buffer
+    await asyncio.to_thread(query_logger.stop)
+
+app = FastAPI(title="Company Chatbot API", lifespan=lifespan)
+metrics.register_api_collector()
 
 # Include the routers
 app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
@@ -18,4 +37,21 @@ app.include_router(companies.router, prefix="/companies", tags=["Companies"])
 
 @app.get("/")
 def read_root():
-    return {"status": "ok", "message": "Welcome to the Chatbot API!"}
\ No newline at end of file
+    return {"status": "ok", "message": "Welcome to the Chatbot API!"}
+
+@app.get("/health/db_pool")
+def read_db_pool_metrics():
+    """
+    Connection pool usage of this API process: checked-out connections,
+    overflow in use and how long requests waited for a connection.
+    """
+    return pool_metrics()
+
+@app.get("/metrics")
+def read_metrics():
+    """
+    Prometheus metrics of this API process: chat stage latencies, request
+    outcomes, in-flight streams, cache hits, the ingestion queue and the DB pool.
+    Ingestion stage latencies come from the worker's own metrics port.
+    """
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
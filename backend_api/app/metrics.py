@@ -0,0 +1,156 @@
+# backend_api/app/metrics.py
+#
+# Prometheus metrics. The API serves them at /metrics. The ingestion worker
+# serves its own on WORKER_METRICS_PORT, summed over its worker processes with
+# prometheus_client's multiprocess mode (see app/worker.py).
+#
+# With METRICS_COMPANY_LABELS off (the default) the "company" label is left
+# empty, which Prometheus treats as absent, so the number of series does not
+# grow with the number of companies.
+
+import os
+from dotenv import load_dotenv
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+load_dotenv()
+
+METRICS_COMPANY_LABELS = os.getenv("METRICS_COMPANY_LABELS", "false").lower() in ("1", "true", "yes")
+
+# Seconds; chat stages range from milliseconds (cache hits) to a long generation,
+# ingestion stages up to many minutes for large documents
+CHAT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+INGESTION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+CHAT_STAGE_SECONDS = Histogram(
+    "chatbot_chat_stage_seconds",
+    "Time spent in each stage of a chat request (embed, cache_lookup, retrieve, first_token, generate, total).",
+    ["endpoint", "stage", "company"],
+    buckets=CHAT_BUCKETS,
+)
+CHAT_REQUESTS = Counter(
+    "chatbot_chat_requests",
+    "Chat requests by outcome (answered, cached, no_context, aborted, error).",
+    ["endpoint", "outcome", "company"],
+)
+CHAT_STREAMS_IN_FLIGHT = Gauge(
+    "chatbot_chat_streams_in_flight",
+    "Streaming chat responses currently being sent.",
+    multiprocess_mode="livesum",
+)
+INGESTION_STAGE_SECONDS = Histogram(
+    "chatbot_ingestion_stage_seconds",
+    "Time spent in each stage of ingesting a document (extract, chunk, embed, store, total).",
+    ["stage", "company"],
+    buckets=INGESTION_BUCKETS,
+)
+INGESTION_JOBS = Counter(
+    "chatbot_ingestion_jobs",
+    "Ingestion jobs run by the worker, by kind and outcome (succeeded, failed, cancelled).",
+    ["kind", "outcome"],
+)
+
+
+def company_label(company_id) -> str:
+    return str(company_id) if METRICS_COMPANY_LABELS and company_id is not None else ""
+
+
+def observe_chat(endpoint: str, outcome: str, company_id: int, timer):
+    """
+    Records a finished chat request: its outcome and the time of every stage
+    marked on its StageTimer, plus the total.
+    """
+    company = company_label(company_id)
+    CHAT_REQUESTS.labels(endpoint, outcome, company).inc()
+    for stage, ms in timer.stages.items():
+        CHAT_STAGE_SECONDS.labels(endpoint, stage, company).observe(ms / 1000)
+    CHAT_STAGE_SECONDS.labels(endpoint, "total", company).observe(timer.elapsed_ms() / 1000)
+
+
+def observe_ingestion(result: dict, company_id: int):
+    """
+    Records the stage timings of a processed document (the stats returned by
+    process_and_store_document).
+    """
+    company = company_label(company_id)
+    for stage, seconds in result["stage_seconds"].items():
+        INGESTION_STAGE_SECONDS.labels(stage, company).observe(seconds)
+    INGESTION_STAGE_SECONDS.labels("total", company).observe(result["total_seconds"])
+
+
+class ApiStateCollector:
+    """
+    Values read when /metrics is scraped instead of being updated on every
+    event: the ingestion queue, cache hit counters, the database pool and the
+    query log buffer. Only registered by the API process.
+    """
+
+    def describe(self):
+        # Keeps REGISTRY.register() from calling collect() (and the database) at startup
+        return []
+
+    def collect(self):
+        from sqlalchemy import func
+        from . import models
+        from .database import SessionLocal, pool_metrics
+        from .embedding_cache import query_embedding_cache
+        from .answer_cache import answer_cache
+        from .query_log import query_logger
+
+        jobs = GaugeMetricFamily(
+            "chatbot_ingestion_jobs_pending", "Ingestion jobs waiting or running, by status.", labels=["status"]
+        )
+        db = SessionLocal()
+        try:
+            counts = dict(
+                db.query(models.IngestionJob.status, func.count(models.IngestionJob.id))
+                .filter(models.IngestionJob.status.in_([models.JobStatusEnum.queued, models.JobStatusEnum.running]))
+                .group_by(models.IngestionJob.status)
+                .all()
+            )
+        except Exception as e:
+            counts = None
+            print(f"Metrics: failed to count ingestion jobs: {e}")
+        finally:
+            db.close()
+        if counts is not None:
+            for status in (models.JobStatusEnum.queued, models.JobStatusEnum.running):
+                jobs.add_metric([status.value], counts.get(status, 0))
+            yield jobs
+
+        lookups = CounterMetricFamily(
+            "chatbot_cache_lookups", "Cache lookups by cache and result.", labels=["cache", "result"]
+        )
+        for name, cache in (("query_embedding", query_embedding_cache), ("answer", answer_cache)):
+            stats = cache.stats()
+            lookups.add_metric([name, "hit"], stats["hits"])
+            lookups.add_metric([name, "miss"], stats["misses"])
+        yield lookups
+
+        pool = pool_metrics()
+        connections = GaugeMetricFamily(
+            "chatbot_db_pool_connections", "Database pool connections by state.", labels=["state"]
+        )
+        connections.add_metric(["checked_out"], pool["checked_out"])
+        connections.add_metric(["checked_in"], pool["checked_in"])
+        connections.add_metric(["overflow"], pool["overflow"])
+        yield connections
+        yield CounterMetricFamily(
+            "chatbot_db_pool_wait_seconds", "Total time spent waiting for a pool connection.",
+            value=pool["wait_seconds_total"],
+        )
+        yield CounterMetricFamily(
+            "chatbot_db_pool_timeouts", "Checkouts that gave up waiting for a connection.", value=pool["timeouts"]
+        )
+
+        query_log = query_logger.stats()
+        yield GaugeMetricFamily(
+            "chatbot_query_log_buffered", "Chat query records waiting to be written.", value=query_log["buffered"]
+        )
+        yield CounterMetricFamily(
+            "chatbot_query_log_dropped", "Chat query records that could not be written.", value=query_log["dropped"]
+        )
+
+
+def register_api_collector():
+    REGISTRY.register(ApiStateCollector())
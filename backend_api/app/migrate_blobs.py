@@ -0,0 +1,62 @@
+# backend_api/app/migrate_blobs.py
+#
+# Moves file bytes stored in documents.file_data into the blob store:
+#
+#     python -m app.migrate_blobs
+#
+# Documents are migrated one at a time, so only one file is held in memory,
+# and the command can be re-run safely if interrupted.
+
+from sqlalchemy.orm import object_session, undefer
+from . import blob_store, models
+from .database import SessionLocal, engine
+from .schema_upgrades import upgrade_schema
+
+
+def move_file_data_to_blob_store(document: models.Document):
+    """
+    Stores the document's in-row bytes as a blob and clears the column.
+    The caller commits.
+    """
+    content_hash, size = blob_store.put_bytes(document.file_data, db=object_session(document))
+    document.content_hash = content_hash
+    document.file_size = size
+    document.file_data = None
+
+
+def migrate():
+    upgrade_schema(engine)
+
+    db = SessionLocal()
+    try:
+        document_ids = [
+            document_id
+            for (document_id,) in db.query(models.Document.id)
+            .filter(models.Document.file_data.isnot(None))
+            .order_by(models.Document.id)
+            .all()
+        ]
+        print(f"Moving file data of {len(document_ids)} documents to the blob store at '{blob_store.BLOB_STORE_DIR}'...")
+
+        for i, document_id in enumerate(document_ids, start=1):
+            document = (
+                db.query(models.Document)
+                .options(undefer(models.Document.file_data))
+                .filter(models.Document.id == document_id)
+                .first()
+            )
+            if document is None or document.file_data is None:
+                continue
+            move_file_data_to_blob_store(document)
+            db.commit()
+            # Drop the loaded bytes before the next document
+            db.expunge(document)
+            print(f"[{i}/{len(document_ids)}] document_id {document_id} -> {document.content_hash}")
+
+        print("Blob migration finished.")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,70 @@
+# backend_api/app/migrate_collections.py
+#
+# One-off migration from the shared "company_documents" collection to one
+# collection per company:
+#
+#     python -m app.migrate_collections [--batch-size 500] [--drop-legacy]
+#
+# Chunks are upserted, so the command can safely be re-run if interrupted.
+
+import argparse
+from .vector_store import LEGACY_COLLECTION_NAME, ChromaVectorStore, get_vector_store
+
+
+def migrate(batch_size: int = 500, drop_legacy: bool = False):
+    store = get_vector_store()
+    if not isinstance(store, ChromaVectorStore):
+        print("The legacy shared collection only exists in the Chroma backend, nothing to migrate.")
+        return
+
+    legacy = store.legacy_collection()
+    if legacy is None:
+        print(f"No '{LEGACY_COLLECTION_NAME}' collection found, nothing to migrate.")
+        return
+
+    total = legacy.count()
+    print(f"Migrating {total} chunks from '{LEGACY_COLLECTION_NAME}' to per-company collections...")
+
+    moved = 0
+    skipped = 0
+    offset = 0
+    while True:
+        page = legacy.get(include=["embeddings", "metadatas"], limit=batch_size, offset=offset)
+        ids = page["ids"]
+        if not ids:
+            break
+        offset += len(ids)
+
+        by_company = {}
+        for chunk_id, embedding, metadata in zip(ids, page["embeddings"], page["metadatas"]):
+            company_id = (metadata or {}).get("company_id")
+            if company_id is None:
+                skipped += 1
+                continue
+            group = by_company.setdefault(company_id, ([], [], []))
+            group[0].append(chunk_id)
+            group[1].append(embedding)
+            group[2].append(metadata)
+
+        for company_id, (group_ids, embeddings, metadatas) in by_company.items():
+            store.add(company_id, ids=group_ids, embeddings=embeddings, metadatas=metadatas)
+            moved += len(group_ids)
+
+        print(f"Migrated {moved}/{total} chunks...")
+
+    print(f"Migration finished: {moved} chunks moved, {skipped} without company_id skipped.")
+
+    if drop_legacy:
+        if skipped:
+            print(f"Keeping '{LEGACY_COLLECTION_NAME}' because {skipped} chunks could not be assigned to a company.")
+        else:
+            store.drop_legacy_collection()
+            print(f"Dropped legacy collection '{LEGACY_COLLECTION_NAME}'.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move chunks into per-company Chroma collections.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--drop-legacy", action="store_true", help="Delete the shared collection afterwards.")
+    args = parser.parse_args()
+    migrate(batch_size=args.batch_size, drop_legacy=args.drop_legacy)
@@ -11,8 +11,10 @@ from sqlalchemy import (
     Enum,
     Boolean,
     Text,
+    JSON,
+    Float,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime
 from .database import Base
 
@@ -25,6 +27,23 @@ class StatusEnum(str, enum.Enum):
     completed = "completed"
     failed = "failed"
 
+class JobStatusEnum(str, enum.Enum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+
+class BatchStatusEnum(str, enum.Enum):
+    running = "running"
+    completed = "completed"
+    failed = "failed"
+
+class BatchItemStatusEnum(str, enum.Enum):
+    pending = "pending"
+    fetching = "fetching"
+    queued = "queued"
+    failed = "failed"
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -54,11 +73,92 @@ class Document(Base):
     file_size = Column(Integer)
     uploaded_at = Column(DateTime, default=datetime.utcnow)
     status = Column(Enum(StatusEnum), default=StatusEnum.processing)
-    file_data = Column(LargeBinary)
+    # File bytes live in the blob store (app/blob_store.py), addressed by content_hash
+    content_hash = Column(String(64), index=True, nullable=True)
+    # Blob fetched by a URL refresh that is still being ingested; becomes
+    # content_hash once the refresh succeeds
+    pending_content_hash = Column(String(64), index=True, nullable=True)
+    # Legacy in-row storage, only read by `python -m app.migrate_blobs`; deferred so
+    # metadata queries never load it
+    file_data = deferred(Column(LargeBinary))
     company_id = Column(Integer, ForeignKey("companies.id"))
     source_url = Column(String, nullable=True)
+    # HTTP validators of the last fetch of source_url, sent back on refresh
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)
+    last_refreshed_at = Column(DateTime, nullable=True)
+    # Ingestion progress: queued / extracting / embedding / retrying / completed / failed
+    ingestion_stage = Column(String(16), nullable=True)
+    # Chunk counts and seconds per stage (extract, chunk, embed, store) of the last ingestion
+    ingestion_stats = Column(JSON, nullable=True)
+    error_message = Column(Text, nullable=True)
+    processed_at = Column(DateTime, nullable=True)
 
     company = relationship("Company", back_populates="documents")
+    ingestion_jobs = relationship(
+        "IngestionJob", back_populates="document", cascade="all, delete-orphan", passive_deletes=True
+    )
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), index=True)
+    company_id = Column(Integer, ForeignKey("companies.id"))
+    # "ingest" for new documents, "refresh" to re-fetch a URL document and apply only what changed
+    kind = Column(String(16), default="ingest", nullable=False)
+    status = Column(Enum(JobStatusEnum), default=JobStatusEnum.queued, index=True)
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=5)
+    run_after = Column(DateTime, default=datetime.utcnow, index=True)
+    locked_by = Column(String, nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    document = relationship("Document", back_populates="ingestion_jobs")
+
+class IngestionBatch(Base):
+    __tablename__ = "ingestion_batches"
+    id = Column(Integer, primary_key=True, index=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), index=True)
+    sitemap_url = Column(String, nullable=True)
+    status = Column(Enum(BatchStatusEnum), default=BatchStatusEnum.running)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    # API process running the batch and its last heartbeat (see app/url_batches.py)
+    locked_by = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+
+    items = relationship(
+        "IngestionBatchItem", back_populates="batch", cascade="all, delete-orphan", passive_deletes=True,
+        order_by="IngestionBatchItem.id",
+    )
+
+class IngestionBatchItem(Base):
+    __tablename__ = "ingestion_batch_items"
+    id = Column(Integer, primary_key=True, index=True)
+    batch_id = Column(Integer, ForeignKey("ingestion_batches.id", ondelete="CASCADE"), index=True)
+    url = Column(String)
+    status = Column(Enum(BatchItemStatusEnum), default=BatchItemStatusEnum.pending, index=True)
+    # Set once the URL is fetched and handed to the ingestion queue
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="SET NULL"), nullable=True)
+    error = Column(Text, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    batch = relationship("IngestionBatch", back_populates="items")
+    document = relationship("Document")
+
+class ChunkEmbedding(Base):
+    __tablename__ = "chunk_embeddings"
+    # sha256 of (embed model, input_type, chunk text)
+    content_hash = Column(String(64), primary_key=True)
+    model = Column(String)
+    input_type = Column(String)
+    dimensions = Column(Integer)
+    embedding = Column(LargeBinary)  # little-endian float32 vector
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 class UserQuery(Base):
     __tablename__ = "user_queries"
@@ -68,5 +168,13 @@ class UserQuery(Base):
     query_time = Column(DateTime, default=datetime.utcnow)
     user_id = Column(Integer, ForeignKey("users.id"))
     company_id = Column(Integer, ForeignKey("companies.id"))
+    # Written in batches by app/query_log.py
+    retrieved_chunk_ids = Column(JSON, nullable=True)
+    # Milliseconds per chat stage (embed, cache_lookup, retrieve, generate, ...)
+    stage_ms = Column(JSON, nullable=True)
+    total_ms = Column(Float, nullable=True)
+    input_tokens = Column(Integer, nullable=True)
+    output_tokens = Column(Integer, nullable=True)
+    answer_cache_hit = Column(Boolean, default=False)
 
     user = relationship("User", back_populates="user_queries")
\ No newline at end of file
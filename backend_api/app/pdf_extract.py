@@ -0,0 +1,98 @@
+# backend_api/app/pdf_extract.py
+#
+# Parallel PDF text extraction. pypdf is pure Python and CPU-bound, so pages
+# are split into ranges that a process pool extracts side by side; results are
+# yielded back in page order while later ranges are still being extracted.
+#
+# This module is deliberately light: pool processes are spawned and import
+# only it (and pypdf), not the embedding and database clients.
+
+import os
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pypdf import PdfReader
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Every ingestion worker process gets its own pool, so by default the cores are
+# split between the INGEST_WORKER_CONCURRENCY workers.
+PDF_EXTRACT_PROCESSES = int(os.getenv(
+    "PDF_EXTRACT_PROCESSES",
+    str(max(1, (os.cpu_count() or 1) // int(os.getenv("INGEST_WORKER_CONCURRENCY", "2")))),
+))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=PDF_EXTRACT_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _extract_page_range(file_path: str, start: int, end: int) -> list[str]:
+    """
+    Runs in a pool process: text of pages [start, end) of the PDF.
+    """
+    reader = PdfReader(file_path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def iter_pdf_pages(file_path: str):
+    """
+    Yields (page number starting at 1, text) for every page, in order.
+    Small PDFs are extracted inline; larger ones in page ranges of
+    PDF_PAGES_PER_TASK across the pool, with at most two ranges per pool
+    process in flight so memory stays bounded.
+    """
+    reader = PdfReader(file_path)
+    page_count = len(reader.pages)
+    if PDF_EXTRACT_PROCESSES <= 1 or page_count <= PDF_PAGES_PER_TASK:
+        for number, page in enumerate(reader.pages, start=1):
+            yield number, page.extract_text() or ""
+        return
+    del reader
+
+    pool = _get_pool()
+    ranges = iter(range(0, page_count, PDF_PAGES_PER_TASK))
+    in_flight = deque()
+
+    def submit_next():
+        start = next(ranges, None)
+        if start is not None:
+            end = min(start + PDF_PAGES_PER_TASK, page_count)
+            in_flight.append((start, pool.submit(_extract_page_range, file_path, start, end)))
+
+    try:
+        for _ in range(PDF_EXTRACT_PROCESSES * 2):
+            submit_next()
+        while in_flight:
+            start, future = in_flight.popleft()
+            texts = future.result()
+            submit_next()
+            yield from enumerate(texts, start=start + 1)
+    except BrokenProcessPool:
+        # A pool process died (e.g. out of memory); start a fresh pool next time
+        _reset_pool()
+        raise
+    finally:
+        for _, future in in_flight:
+            future.cancel()
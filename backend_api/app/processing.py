@@ -1,93 +1,389 @@
 # backend_api/app/processing.py
 
 import os
+import time
+import hashlib
+from datetime import datetime
+from itertools import islice
 import cohere
-import chromadb
-from pypdf import PdfReader
+import httpx
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from dotenv import load_dotenv
-from bs4 import BeautifulSoup
+from .embed_batcher import EMBED_BATCH_SIZE
+from .chunk_embedding_cache import embed_with_cache
+from .pdf_extract import iter_pdf_pages
+from .html_extract import extract_html_text
+from .database import SessionLocal
+from . import models
+from .vector_store import get_vector_store
+from . import bm25_index, metrics
 
 load_dotenv()
 
 COHERE_API_KEY = os.getenv("COHERE_API_KEY")
 co = cohere.Client(COHERE_API_KEY)
-db_client = chromadb.PersistentClient(path="chroma_db")
-collection = db_client.get_or_create_collection(name="company_documents")
+# Used by the chat path so in-flight generations don't hold threadpool threads.
+# httpx allows only 100 connections by default, which would cap concurrent streams.
+COHERE_MAX_CONNECTIONS = int(os.getenv("COHERE_MAX_CONNECTIONS", "500"))
+async_co = cohere.AsyncClient(
+    COHERE_API_KEY,
+    httpx_client=httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=COHERE_MAX_CONNECTIONS, max_keepalive_connections=100),
+        timeout=httpx.Timeout(300.0, connect=10.0),
+    ),
+)
 
+EMBED_MODEL = "embed-english-v3.0"
 
-def process_and_store_document(file_path: str, filename: str, company_id: int, document_id: int):
+# --- Ingestion settings ---
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+# Stages timed for every document (see Document.ingestion_stats)
+INGESTION_STAGES = ("extract", "chunk", "embed", "store")
+# Extensions iter_document_text has a parser for
+SUPPORTED_EXTENSIONS = {"pdf", "html", "htm", "txt"}
+
+
+class DocumentDeleted(Exception):
+    """The document was deleted while it was being ingested."""
+
+
+def make_text_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+
+def iter_document_text(file_path: str, ext: str, name: str = ""):
+    """
+    Yields the text of a document piece by piece as (page number, text), so
+    large files never have to be held in memory as a single string. PDF pages
+    are extracted in parallel by app/pdf_extract.py; other formats have no
+    pages and yield None as the page number. Text files are read in fixed-size
+    blocks that may split a word, which iter_chunks joins back together.
+    """
+    if ext in ["pdf"]:
+        yield from iter_pdf_pages(file_path)
+    elif ext in ["html", "htm"]:
+        # Raw bytes, so the parser can honour the page's declared charset
+        with open(file_path, "rb") as f:
+            extraction = extract_html_text(f.read())
+        if extraction.full_length is not None:
+            # Character counts: counting chunks would mean splitting both texts once more
+            print(
+                f"HTML main-content extraction for {name or file_path}: kept {len(extraction.text)} of "
+                f"{extraction.full_length} characters ({extraction.full_length - len(extraction.text)} "
+                f"boilerplate characters dropped)"
+            )
+        yield None, extraction.text
+    else:
+        # txt, or generic text reading if unknown extension
+        errors = "strict" if ext == "txt" else "ignore"
+        with open(file_path, "r", encoding="utf-8", errors=errors) as f:
+            while block := f.read(CHUNK_SIZE * 64):
+                yield None, block
+
+
+def _chunk_offsets(text: str, chunks: list[str]) -> list[int]:
+    """
+    Start offset of each chunk in `text`. Chunks are substrings in order
+    (overlapping by at most CHUNK_OVERLAP), so each is searched for from
+    where the previous one ends, less the overlap; searching from just after
+    the previous start would match too early in repetitive text.
+    """
+    offsets, position = [], 0
+    for chunk in chunks:
+        found = text.find(chunk, position)
+        if found == -1:
+            found = text.find(chunk, offsets[-1] + 1 if offsets else 0)
+        if found != -1:
+            position = found
+        offsets.append(position)
+        position = max(position + 1, position + len(chunk) - CHUNK_OVERLAP)
+    return offsets
+
+
+def _page_at(page_starts: list[tuple[int, int]], offset: int):
+    page = page_starts[0][1]
+    for start, start_page in page_starts:
+        if start > offset:
+            break
+        page = start_page
+    return page
+
+
+def iter_chunks(text_pieces, text_splitter):
+    """
+    Incrementally chunks a stream of (page, text) pieces. Only the unfinished
+    tail of the text seen so far is kept between pieces; every chunk before it
+    is final and is yielded immediately as (page the chunk starts on, chunk).
+
+    Pieces of a real page (page is not None) are separated by a newline.
+    Pieces without a page are consecutive blocks of one text, which may end
+    mid-word, so they are joined as they are.
+    """
+    buffer = ""
+    page_starts = []  # (offset in buffer, page) where each piece begins
+    for page, piece in text_pieces:
+        if not piece:
+            continue
+        if buffer and page is not None:
+            buffer += "\n"
+        page_starts.append((len(buffer), page))
+        buffer += piece
+        chunks = text_splitter.split_text(buffer)
+        if len(chunks) > 1:
+            offsets = _chunk_offsets(buffer, chunks)
+            for chunk, offset in zip(chunks[:-1], offsets):
+                yield _page_at(page_starts, offset), chunk
+            # The last chunk ends the text, so its last occurrence is the right one
+            tail = buffer.rfind(chunks[-1])
+            if tail == -1:
+                tail = offsets[-1]
+            page_starts = [(0, _page_at(page_starts, tail))] + [
+                (start - tail, start_page) for start, start_page in page_starts if start > tail
+            ]
+            # The splitter strips its chunks; carry the raw text instead, so
+            # whitespace at the end of a piece still separates it from the next
+            buffer = buffer[tail:]
+    if buffer.strip():
+        chunks = text_splitter.split_text(buffer)
+        for chunk, offset in zip(chunks, _chunk_offsets(buffer, chunks)):
+            yield _page_at(page_starts, offset), chunk
+
+
+def batched(iterable, size: int):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def chunk_id_for(document_id: int, text: str) -> str:
+    """
+    Chunk ids are derived from the chunk text, so re-chunking an unchanged
+    passage yields the same id and refreshes can diff old and new chunks.
+    """
+    return f"{document_id}_{hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]}"
+
+
+def timed(iterable, stage: str, stage_seconds: dict):
+    """
+    Passes `iterable` through, adding the time spent producing each item to
+    stage_seconds[stage]. Lazy pipeline stages only run inside next(), so
+    this is where their time is spent.
+    """
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            stage_seconds[stage] += time.perf_counter() - started
+            return
+        stage_seconds[stage] += time.perf_counter() - started
+        yield item
+
+
+def record_progress(db, document_id: int, **fields):
+    """
+    Writes ingestion progress to the document row. Returns False if the
+    document was deleted meanwhile.
+    """
+    updated = (
+        db.query(models.Document)
+        .filter(models.Document.id == document_id)
+        .update(fields, synchronize_session=False)
+    )
+    db.commit()
+    return bool(updated)
+
+
+def process_and_store_document(
+    file_path: str, filename: str, company_id: int, document_id: int, incremental: bool = False
+):
     """
     Reads a document (PDF or HTML/text), chunks it, creates embeddings, and stores them in ChromaDB.
     Works for both file uploads and URL ingestion.
+
+    The document is processed as a pipeline: pages feed the chunker, chunks are
+    embedded in windows of EMBED_BATCH_SIZE and each window is written to
+    ChromaDB as soon as it is embedded, so peak memory does not grow with
+    document size. Chunks whose embedding is already cached (same text, model
+    and input_type) are reused; only the rest go through the shared batcher,
+    which merges windows from concurrent documents into full provider-sized calls.
+
+    With `incremental=True` (URL refreshes) chunks the document already has are
+    left untouched, only new chunks are embedded and stored, and chunks that no
+    longer occur are deleted afterwards. A failure removes the chunks this run
+    added, leaving exactly the previous content in place instead of removing
+    the document.
+
+    Progress (stage, counts and seconds spent extracting, chunking, embedding
+    and storing) is written to the document after every window, and the
+    document is marked completed at the end. Failures are recorded by the
+    ingestion worker, which decides whether the job is retried. If the
+    document is deleted meanwhile, ingestion stops at the next window, the
+    chunks stored so far are removed and DocumentDeleted is raised.
+
+    Returns {"chunks", "unchanged", "added", "removed", "reused", "embedded", "stage_seconds", "total_seconds"}.
     """
     print(f"Starting processing for document_id: {document_id}, filename: {filename}")
 
+    started = time.perf_counter()
+    stage_seconds = {stage: 0.0 for stage in INGESTION_STAGES}
+    stats = {"chunks": 0, "unchanged": 0, "added": 0, "removed": 0, "reused": 0, "embedded": 0}
+    # Ids stored by this run, removed again if an incremental run fails
+    added_ids = []
+
+    def snapshot():
+        # Chunking pulls text from the extractor, so its measured time includes extraction
+        seconds = dict(stage_seconds, chunk=max(stage_seconds["chunk"] - stage_seconds["extract"], 0.0))
+        return dict(
+            stats,
+            stage_seconds={stage: round(value, 3) for stage, value in seconds.items()},
+            total_seconds=round(time.perf_counter() - started, 3),
+        )
+
+    def progress(**fields):
+        if not record_progress(db, document_id, **fields):
+            raise DocumentDeleted(f"Document {document_id} was deleted during ingestion.")
+
+    db = SessionLocal()
     try:
+        progress(ingestion_stage="extracting", error_message=None)
+
         # Determine file type by extension
-        text = ""
         ext = filename.split('.')[-1].lower()
 
-        if ext in ["pdf"]:
-            reader = PdfReader(file_path)
-            for page in reader.pages:
-                text += page.extract_text() or ""
-        elif ext in ["html", "htm", "txt"]:
-            with open(file_path, "r", encoding="utf-8") as f:
-                content = f.read()
-            if ext in ["html", "htm"]:
-                soup = BeautifulSoup(content, "html.parser")
-                text = soup.get_text(separator="\n", strip=True)
-            else:  # txt
-                text = content
-        else:
-            # Try generic text reading if unknown extension
-            with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                text = f.read()
-
-        if not text.strip():
-            print(f"No text extracted from document_id: {document_id}")
-            return
+        text_splitter = make_text_splitter()
+        pieces = timed(iter_document_text(file_path, ext, name=f"document_id {document_id}"), "extract", stage_seconds)
+        chunks = timed(iter_chunks(pieces, text_splitter), "chunk", stage_seconds)
+
+        store = get_vector_store()
+        existing = set(store.get_ids(company_id, where={"document_id": document_id})) if incremental else set()
+        seen = set()
+        for window in batched(chunks, EMBED_BATCH_SIZE):
+            # Repeated passages (headers, footers) are stored once per document
+            new_chunks = {}
+            for page, chunk in window:
+                chunk_id = chunk_id_for(document_id, chunk)
+                if chunk_id in seen:
+                    continue
+                seen.add(chunk_id)
+                stats["chunks"] += 1
+                if chunk_id in existing:
+                    stats["unchanged"] += 1
+                else:
+                    new_chunks[chunk_id] = (page, chunk)
+            if not new_chunks:
+                continue
+
+            ids = list(new_chunks)
+            pages = [page for page, _ in new_chunks.values()]
+            texts = [chunk for _, chunk in new_chunks.values()]
+            # Create embeddings (cache lookups for the whole window happen in one query)
+            stage_started = time.perf_counter()
+            embeddings, reused, embedded = embed_with_cache(
+                db, texts, model=EMBED_MODEL, input_type="search_document"
+            )
+            stage_seconds["embed"] += time.perf_counter() - stage_started
+            stats["reused"] += reused
+            stats["embedded"] += embedded
+
+            # Prepare metadata for ChromaDB
+            metadatas = [{
+                "company_id": company_id,
+                "document_id": document_id,
+                "filename": filename,
+                "chunk_id": chunk_id,
+                "text_chunk": chunk
+            } for chunk_id, chunk in zip(ids, texts)]
+            # Chroma metadata values cannot be None, so "page" is only set for paged formats
+            for metadata, page in zip(metadatas, pages):
+                if page is not None:
+                    metadata["page"] = page
 
-        # Split text into chunks
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-        chunks = text_splitter.split_text(text)
-        print(f"Document split into {len(chunks)} chunks.")
+            stage_started = time.perf_counter()
+            # Recorded first, so a window that fails half-way is removed too
+            added_ids.extend(ids)
+            store.add(company_id, ids=ids, embeddings=embeddings, metadatas=metadatas)
+            bm25_index.add_chunks(company_id, [
+                (chunk_id, document_id, filename, chunk) for chunk_id, chunk in zip(ids, texts)
+            ])
+            stage_seconds["store"] += time.perf_counter() - stage_started
+            stats["added"] += len(ids)
+            progress(ingestion_stage="embedding", ingestion_stats=snapshot())
+            print(f"Stored {stats['added']} new chunks so far for document_id: {document_id}")
 
-        # Create embeddings
-        response = co.embed(
-            texts=chunks, model="embed-english-v3.0", input_type="search_document"
+        stale = list(existing - seen)
+        if stale:
+            # From here on the new chunks are the document; a retry finishes the cleanup
+            added_ids.clear()
+            stage_started = time.perf_counter()
+            store.delete(company_id, ids=stale)
+            bm25_index.delete_chunks(company_id, stale)
+            stage_seconds["store"] += time.perf_counter() - stage_started
+            stats["removed"] = len(stale)
+
+        result = snapshot()
+        metrics.observe_ingestion(result, company_id)
+        progress(
+            status=models.StatusEnum.completed,
+            ingestion_stage="completed",
+            ingestion_stats=result,
+            processed_at=datetime.utcnow(),
         )
-        embeddings = response.embeddings
-        print("Embeddings created successfully.")
-
-        # Prepare metadata for ChromaDB
-        ids = [f"{document_id}_{i}" for i in range(len(chunks))]
-        metadatas = [{
-            "company_id": company_id,
-            "document_id": document_id,
-            "filename": filename,
-            "chunk_id": f"{document_id}_{i}",
-            "text_chunk": chunk
-        } for i, chunk in enumerate(chunks)]
-
-        collection.add(ids=ids, embeddings=embeddings, metadatas=metadatas)
-        print(f"Embeddings stored in ChromaDB for document_id: {document_id}")
 
+        if not stats["chunks"]:
+            print(f"No text extracted from document_id: {document_id}")
+            return result
+
+        print(
+            f"Embeddings stored in ChromaDB for document_id: {document_id} "
+            f"({stats['chunks']} chunks: {stats['unchanged']} unchanged, {stats['added']} added, "
+            f"{stats['removed']} removed; {stats['reused']} reused from cache, {stats['embedded']} embedded fresh; "
+            f"seconds per stage: {result['stage_seconds']}, total {result['total_seconds']})"
+        )
+        return result
+
+    except DocumentDeleted:
+        print(f"Document_id {document_id} was deleted during ingestion, removing the chunks stored so far.")
+        db.rollback()
+        # The delete endpoint already cleaned up, but windows stored after that would stay searchable
+        delete_document_from_chroma(document_id, company_id)
+        raise
     except Exception as e:
         print(f"An error occurred during processing for document_id {document_id}: {e}")
+        db.rollback()
+        # Windows stored before the failure would leave a partial document behind
+        if not incremental:
+            delete_document_from_chroma(document_id, company_id)
+        elif added_ids:
+            delete_chunks_from_chroma(company_id, added_ids)
+        # Re-raise so the ingestion worker can retry the job
+        raise
     finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            print(f"Removed temporary file: {file_path}")
+        db.close()
+
+
+def delete_chunks_from_chroma(company_id: int, chunk_ids: list[str]):
+    """
+    Deletes the given chunks from ChromaDB and the BM25 keyword index.
+    """
+    try:
+        get_vector_store().delete(company_id, ids=chunk_ids)
+        bm25_index.delete_chunks(company_id, chunk_ids)
+        print(f"Deleted {len(chunk_ids)} chunks from ChromaDB.")
+    except Exception as e:
+        print(f"Failed to delete {len(chunk_ids)} chunks from ChromaDB: {e}")
 
 
-def delete_document_from_chroma(document_id: int):
+def delete_document_from_chroma(document_id: int, company_id: int):
     """
-    Deletes all document chunks from ChromaDB for a given document_id.
+    Deletes all document chunks from ChromaDB (and the BM25 keyword index)
+    for a given document_id.
     """
     try:
-        collection.delete(where={"document_id": document_id})
+        get_vector_store().delete(company_id, where={"document_id": document_id})
+        bm25_index.delete_document(company_id, document_id)
         print(f"Successfully deleted chunks for document_id: {document_id} from ChromaDB.")
     except Exception as e:
-        print(f"Failed to delete chunks for document_id {document_id} from ChromaDB: {e}")
\ No newline at end of file
+        print(f"Failed to delete chunks for document_id {document_id} from ChromaDB: {e}")
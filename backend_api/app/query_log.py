@@ -0,0 +1,171 @@
+# backend_api/app/query_log.py
+#
+# Chat query log. Chat handlers only append a record to an in-memory buffer; a
+# background thread writes the buffer to user_queries with bulk inserts once
+# QUERY_LOG_BATCH_SIZE records are waiting or QUERY_LOG_FLUSH_SECONDS have
+# passed, so answering a question never waits on the database.
+
+import os
+import time
+import threading
+from collections import deque
+from datetime import datetime
+from dotenv import load_dotenv
+from sqlalchemy import insert
+from . import models
+from .database import SessionLocal
+
+load_dotenv()
+
+QUERY_LOG_ENABLED = os.getenv("QUERY_LOG_ENABLED", "true").lower() in ("1", "true", "yes")
+QUERY_LOG_BATCH_SIZE = int(os.getenv("QUERY_LOG_BATCH_SIZE", "100"))
+QUERY_LOG_FLUSH_SECONDS = float(os.getenv("QUERY_LOG_FLUSH_SECONDS", "2"))
+# While the database is unreachable records pile up; beyond this the oldest are dropped
+QUERY_LOG_MAX_BUFFER = int(os.getenv("QUERY_LOG_MAX_BUFFER", "10000"))
+
+
+class StageTimer:
+    """
+    Collects how many milliseconds each stage of a chat request took.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._start = self._last = time.perf_counter()
+
+    def mark(self, stage: str):
+        """Ends `stage`: records the time since the previous mark (or the start)."""
+        now = time.perf_counter()
+        self.stages[stage] = round((now - self._last) * 1000, 1)
+        self._last = now
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self._start) * 1000, 1)
+
+
+class QueryLogger:
+    """
+    Buffers chat query records and writes them to user_queries from a
+    background thread. A batch that fails to insert is dropped and counted
+    rather than retried, so a database outage cannot grow the buffer forever.
+    """
+
+    def __init__(self, batch_size: int, flush_seconds: float, max_buffer: int):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._buffer = deque(maxlen=max_buffer)
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+        self.written = 0
+        self.dropped = 0
+        self.failed_batches = 0
+
+    def start(self):
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="query-log-writer", daemon=True)
+            self._thread.start()
+
+    def record(
+        self,
+        query: str,
+        answer: str,
+        company_id: int,
+        user_id: int | None,
+        chunk_ids: list[str],
+        timer: StageTimer,
+        input_tokens: int | None = None,
+        output_tokens: int | None = None,
+        answer_cache_hit: bool = False,
+    ):
+        """
+        Queues one chat query for the next bulk insert. Never blocks on the database.
+        """
+        if not QUERY_LOG_ENABLED:
+            return
+        row = {
+            "query_text": query,
+            "response_text": answer,
+            "query_time": datetime.utcnow(),
+            "user_id": user_id,
+            "company_id": company_id,
+            "retrieved_chunk_ids": chunk_ids,
+            "stage_ms": dict(timer.stages),
+            "total_ms": timer.elapsed_ms(),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "answer_cache_hit": answer_cache_hit,
+        }
+        with self._condition:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append(row)
+            if len(self._buffer) >= self.batch_size:
+                self._condition.notify()
+
+    def _take_batch(self) -> list[dict]:
+        count = min(len(self._buffer), self.batch_size)
+        return [self._buffer.popleft() for _ in range(count)]
+
+    def _write(self, rows: list[dict]):
+        db = SessionLocal()
+        try:
+            db.execute(insert(models.UserQuery), rows)
+            db.commit()
+            with self._condition:
+                self.written += len(rows)
+        except Exception as e:
+            db.rollback()
+            with self._condition:
+                self.failed_batches += 1
+                self.dropped += len(rows)
+            print(f"Query log: failed to write {len(rows)} records: {e}")
+        finally:
+            db.close()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._stopping or len(self._buffer) >= self.batch_size,
+                    timeout=self.flush_seconds,
+                )
+                stopping = self._stopping
+                rows = self._take_batch()
+            if rows:
+                self._write(rows)
+            if stopping:
+                return
+
+    def stop(self, timeout: float = 10):
+        """
+        Stops the writer and flushes everything still buffered. Called on shutdown.
+        """
+        with self._condition:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+            self._condition.notify()
+        if thread is not None:
+            thread.join(timeout)
+        while True:
+            with self._condition:
+                rows = self._take_batch()
+            if not rows:
+                break
+            self._write(rows)
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "buffered": len(self._buffer),
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed_batches": self.failed_batches,
+            }
+
+
+query_logger = QueryLogger(QUERY_LOG_BATCH_SIZE, QUERY_LOG_FLUSH_SECONDS, QUERY_LOG_MAX_BUFFER)
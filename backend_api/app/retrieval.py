@@ -0,0 +1,174 @@
+# backend_api/app/retrieval.py
+
+import os
+import re
+import asyncio
+from dotenv import load_dotenv
+from . import bm25_index
+from .vector_store import get_vector_store
+
+load_dotenv()
+
+# --- Retrieval settings ---
+# Each retriever contributes RETRIEVAL_CANDIDATES results; the fused list is cut to RETRIEVAL_TOP_K.
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "6"))
+RETRIEVAL_HYBRID = os.getenv("RETRIEVAL_HYBRID", "true").lower() == "true"
+# Standard RRF damping constant from Cormack et al.
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# --- Context packing settings ---
+# Vector hits further than this (Chroma's default squared L2; for normalized
+# embeddings 2 - 2*cosine) are dropped unless the keyword index also found them.
+RETRIEVAL_MAX_DISTANCE = float(os.getenv("RETRIEVAL_MAX_DISTANCE", "1.5"))
+# MMR trade-off between relevance (1.0) and novelty (0.0)
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+# Chunks at least this similar (word-set Jaccard) to an already selected chunk are near-duplicates
+NEAR_DUPLICATE_SIMILARITY = float(os.getenv("NEAR_DUPLICATE_SIMILARITY", "0.8"))
+# Token budget for all chunk text sent to co.chat (estimated at ~4 characters per token)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CHARS_PER_TOKEN = 4
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = RRF_K) -> list[tuple[str, float]]:
+    """
+    Merges several ranked lists of chunk ids into one. Every appearance adds
+    1 / (k + rank), so chunks ranked well by both retrievers rise to the top.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def _vector_search(company_id: int, query_embedding, n_results: int) -> list[dict]:
+    results = get_vector_store().query(company_id, query_embeddings=query_embedding, n_results=n_results)
+    ids = results.get("ids", [[]])[0]
+    metadatas = results.get("metadatas", [[]])[0]
+    distances = (results.get("distances") or [[None] * len(ids)])[0]
+    return [
+        dict(metadata, chunk_id=metadata.get("chunk_id", chunk_id), distance=distance)
+        for chunk_id, metadata, distance in zip(ids, metadatas, distances)
+    ]
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def _word_set(text: str) -> frozenset:
+    return frozenset(_WORD_RE.findall(text.lower()))
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _dropped(chunk: dict, reason: str) -> dict:
+    return {"id": chunk["chunk_id"], "filename": chunk.get("filename"), "reason": reason}
+
+
+def pack_context(candidates: list[tuple[dict, float]], top_k: int, token_budget: int):
+    """
+    Selects chunks from `candidates` ((chunk, fused score), best first) with
+    maximal marginal relevance: each pick maximizes
+    MMR_LAMBDA * relevance - (1 - MMR_LAMBDA) * similarity to chunks already picked.
+    Near-duplicates are dropped outright, and picking stops at `top_k` chunks
+    or when the next chunk would exceed `token_budget`.
+
+    Returns (selected chunks, dropped chunks with the reason each was dropped).
+    """
+    if not candidates:
+        return [], []
+
+    best_score = candidates[0][1] or 1.0
+    remaining = [(chunk, score / best_score, _word_set(chunk.get("text_chunk", ""))) for chunk, score in candidates]
+    selected = []  # (chunk, word set)
+    dropped = []
+    tokens_used = 0
+
+    while remaining:
+        best_index, best_mmr, best_similar_to = None, None, None
+        for i, (chunk, relevance, words) in enumerate(remaining):
+            similarity, similar_to = 0.0, None
+            for picked, picked_words in selected:
+                overlap = _jaccard(words, picked_words)
+                if overlap > similarity:
+                    similarity, similar_to = overlap, picked["chunk_id"]
+            mmr = MMR_LAMBDA * relevance - (1 - MMR_LAMBDA) * similarity
+            if best_mmr is None or mmr > best_mmr:
+                best_index, best_mmr, best_similar_to = i, mmr, (similarity, similar_to)
+
+        chunk, _, words = remaining.pop(best_index)
+        similarity, similar_to = best_similar_to
+
+        if similarity >= NEAR_DUPLICATE_SIMILARITY:
+            dropped.append(_dropped(chunk, f"near_duplicate_of:{similar_to}"))
+            continue
+        if len(selected) >= top_k:
+            dropped.append(_dropped(chunk, "top_k_reached"))
+            continue
+        tokens = estimate_tokens(chunk.get("text_chunk", ""))
+        if tokens_used + tokens > token_budget:
+            dropped.append(_dropped(chunk, "token_budget_exceeded"))
+            continue
+
+        selected.append((chunk, words))
+        tokens_used += tokens
+
+    return [chunk for chunk, _ in selected], dropped
+
+
+async def retrieve_documents(query: str, query_embedding, company_id: int):
+    """
+    Runs dense (vector store) and keyword (BM25) retrieval side by side,
+    fuses the rankings with reciprocal rank fusion, drops irrelevant and
+    near-duplicate chunks and packs the rest into the context token budget.
+    Both stores are blocking, so they are queried from worker threads.
+
+    Returns (documents in the format expected by co.chat, dropped chunks with reasons).
+    """
+    vector_task = asyncio.to_thread(_vector_search, company_id, query_embedding, RETRIEVAL_CANDIDATES)
+    if RETRIEVAL_HYBRID:
+        keyword_task = asyncio.to_thread(bm25_index.search, company_id, query, RETRIEVAL_CANDIDATES)
+        vector_hits, keyword_hits = await asyncio.gather(vector_task, keyword_task)
+    else:
+        vector_hits, keyword_hits = await vector_task, []
+
+    chunks = {}
+    for hit in vector_hits + keyword_hits:
+        chunks.setdefault(hit["chunk_id"], hit)
+    keyword_ids = {hit["chunk_id"] for hit in keyword_hits}
+
+    dropped = []
+    relevant_vector_ids = []
+    for hit in vector_hits:
+        distance = hit.get("distance")
+        if distance is not None and distance > RETRIEVAL_MAX_DISTANCE and hit["chunk_id"] not in keyword_ids:
+            dropped.append(_dropped(hit, f"distance_above_cutoff:{distance:.3f}"))
+        else:
+            relevant_vector_ids.append(hit["chunk_id"])
+
+    fused = reciprocal_rank_fusion([relevant_vector_ids, [hit["chunk_id"] for hit in keyword_hits]])
+    selected, packing_dropped = pack_context(
+        [(chunks[chunk_id], score) for chunk_id, score in fused], RETRIEVAL_TOP_K, CONTEXT_TOKEN_BUDGET
+    )
+    dropped.extend(packing_dropped)
+
+    if dropped:
+        print(f"Retrieval for company_id {company_id}: kept {len(selected)} chunks, dropped {len(dropped)}: {dropped}")
+
+    documents = [
+        {
+            "id": chunk["chunk_id"],
+            "text": chunk.get("text_chunk", ""),
+            "filename": chunk.get("filename", "Unknown Source")
+        }
+        for chunk in selected
+    ]
+    return documents, dropped
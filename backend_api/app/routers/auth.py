@@ -3,7 +3,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from .. import crud, schemas, security
-from ..database import SessionLocal
+from ..database import get_db
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -13,13 +13,6 @@ class TokenRequest(BaseModel):
     password: str
     company_id: int
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/register", response_model=schemas.User)
 def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db_user = crud.get_user_by_email_and_company(
@@ -43,6 +36,7 @@ def login_for_access_token(request: TokenRequest, db: Session = Depends(get_db))
     access_token = security.create_access_token(
         data={
             "sub": user.email,
+            "user_id": user.id,
             "role": user.role.value,
             "company_id": user.company_id,
             "name": user.name  # NEW
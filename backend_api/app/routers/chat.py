@@ -4,11 +4,13 @@ from fastapi import APIRouter, Depends
 from fastapi.responses import StreamingResponse
 from .. import schemas, security
 from ..chat import get_chatbot_response, get_chatbot_response_stream
+from ..embedding_cache import query_embedding_cache
+from ..answer_cache import answer_cache
 
 router = APIRouter()
 
 @router.post("/query", response_model=schemas.ChatResponse)
-def handle_chat_query(
+async def handle_chat_query(
     request: schemas.ChatQuery,
     current_user: dict = Depends(security.get_current_regular_user)
 ):
@@ -18,11 +20,13 @@ def handle_chat_query(
     - Extracts company_id from the token to ensure data isolation.
     """
     company_id = current_user["company_id"]
-    answer = get_chatbot_response(query=request.query, company_id=company_id)
-    return schemas.ChatResponse(answer=answer)
+    result = await get_chatbot_response(
+        query=request.query, company_id=company_id, user_id=current_user.get("user_id")
+    )
+    return schemas.ChatResponse(**result)
 
 @router.post("/query_stream")
-def handle_chat_query_stream(
+async def handle_chat_query_stream(
     request: schemas.ChatQuery,
     current_user: dict = Depends(security.get_current_regular_user)
 ):
@@ -32,7 +36,20 @@ def handle_chat_query_stream(
     - Extracts company_id from the token to ensure data isolation.
     """
     company_id = current_user["company_id"]
-    # Get the streaming generator from the chat logic
-    generator = get_chatbot_response_stream(query=request.query, company_id=company_id)
+    # Get the async streaming generator from the chat logic; it runs on the
+    # event loop, so a long generation does not hold a threadpool thread
+    generator = get_chatbot_response_stream(
+        query=request.query, company_id=company_id, user_id=current_user.get("user_id")
+    )
     # Return a StreamingResponse from FastAPI
-    return StreamingResponse(generator, media_type="text/plain")
\ No newline at end of file
+    return StreamingResponse(generator, media_type="text/plain")
+
+@router.get("/cache_stats")
+def get_cache_stats(current_admin: dict = Depends(security.get_current_admin_user)):
+    """
+    Admin-only: hit/miss counters for the query-embedding and answer caches.
+    """
+    return {
+        "query_embedding_cache": query_embedding_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+    }
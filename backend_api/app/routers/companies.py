@@ -1,22 +1,19 @@
 #backend_api/app/routers/companies.py
 
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
 from sqlalchemy.orm import Session
 from .. import models, schemas
-from ..database import SessionLocal
+from ..database import get_db
+from ..http_cache import json_response_with_etag
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # The response_model is changed to the new, lighter schema
 @router.get("/", response_model=list[schemas.CompanyPublic])
-def read_companies(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_companies(request: Request, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     companies = db.query(models.Company).offset(skip).limit(limit).all()
-    return companies
\ No newline at end of file
+    # Served with an ETag so the login and signup pages can revalidate their cached copy
+    return json_response_with_etag(
+        request, [schemas.CompanyPublic.model_validate(c) for c in companies]
+    )
\ No newline at end of file
@@ -1,162 +1,331 @@
 #backend_api/app/routers/documents.py
 
 import os
-import uuid
-import requests
-import chromadb
-from fastapi import APIRouter, Depends, UploadFile, File, BackgroundTasks, HTTPException, Body
-from fastapi.responses import Response
+import json
+import time
+import asyncio
+import zipfile
+import mimetypes
+from fastapi import APIRouter, Depends, UploadFile, File, BackgroundTasks, HTTPException, Body, Request
+from fastapi.responses import Response, FileResponse, StreamingResponse
+from dotenv import load_dotenv
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
-from .. import models, security
-from ..database import SessionLocal
-from ..processing import delete_document_from_chroma
+from .. import blob_store, models, schemas, security, url_batches, url_fetcher
+from ..database import SessionLocal, get_db
+from ..processing import SUPPORTED_EXTENSIONS, delete_document_from_chroma
+from ..jobs import IN_FLIGHT_STAGES, JOB_KIND_REFRESH, enqueue_ingestion_job, has_pending_job
+from ..answer_cache import answer_cache
+from ..migrate_blobs import move_file_data_to_blob_store
+from ..http_cache import etag_matches, json_response_with_etag
 
-# Initialize ChromaDB client and collection
-db_client = chromadb.PersistentClient(path="chroma_db")
-collection = db_client.get_or_create_collection(name="company_documents")
+load_dotenv()
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Files (including zip members) accepted by one bulk upload request
+BULK_UPLOAD_MAX_FILES = int(os.getenv("BULK_UPLOAD_MAX_FILES", "500"))
+# How often the progress stream checks the database, and the keep-alive interval.
+# The Streamlit dashboard only handles clicks between stream events, so
+# keep-alives are frequent.
+PROGRESS_POLL_SECONDS = float(os.getenv("PROGRESS_POLL_SECONDS", "1"))
+PROGRESS_HEARTBEAT_SECONDS = 5
 
 # -----------------------
 # Upload file endpoint
 # -----------------------
 @router.post("/upload")
 def upload_document(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     current_admin: dict = Depends(security.get_current_admin_user),
     db: Session = Depends(get_db)
 ):
     company_id = current_admin["company_id"]
-    file_bytes = file.file.read()
-    if not file_bytes:
+    # Streamed straight into the blob store; the upload is never held in memory
+    try:
+        content_hash, file_size = blob_store.put_stream(file.file, db=db)
+    except blob_store.BlobTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if not file_size:
         raise HTTPException(status_code=400, detail="Empty file upload.")
 
     db_document = models.Document(
         filename=file.filename,
         content_type=getattr(file, "content_type", None) or "application/pdf",
-        file_size=len(file_bytes),
-        file_data=file_bytes,
+        file_size=file_size,
+        content_hash=content_hash,
         company_id=company_id,
         status=models.StatusEnum.processing,
     )
     db.add(db_document)
+    # Document row and ingestion job are committed together, so no upload is lost
+    enqueue_ingestion_job(db, db_document)
     db.commit()
     db.refresh(db_document)
-
-    safe_name = file.filename.replace(os.sep, "_")
-    temp_file_path = f"temp_{db_document.id}_{uuid.uuid4().hex}_{safe_name}"
-    with open(temp_file_path, "wb") as f:
-        f.write(file_bytes)
-
-    from ..processing import process_and_store_document
-    background_tasks.add_task(
-        process_and_store_document,
-        file_path=temp_file_path,
-        filename=file.filename,
-        company_id=company_id,
-        document_id=db_document.id
-    )
+    answer_cache.invalidate(company_id)
 
     return {
-        "message": "File uploaded and processing has started.",
+        "message": "File uploaded and queued for processing.",
         "document_id": db_document.id,
         "filename": file.filename
     }
 
+# -----------------------
+# Bulk upload endpoint
+# -----------------------
+def _iter_bulk_sources(files: list[UploadFile]):
+    """
+    Yields (filename, content type, file object) for every uploaded file,
+    expanding zip archives into their members.
+    """
+    for file in files:
+        if (file.filename or "").lower().endswith(".zip"):
+            try:
+                archive = zipfile.ZipFile(file.file)
+            except zipfile.BadZipFile:
+                yield file.filename, None, None
+                continue
+            with archive:
+                for info in archive.infolist():
+                    name = os.path.basename(info.filename)
+                    # Skip folders and macOS resource forks / hidden files
+                    if info.is_dir() or not name or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+                        continue
+                    with archive.open(info) as member:
+                        yield name, mimetypes.guess_type(name)[0], member
+        else:
+            yield file.filename, file.content_type, file.file
+
+
+@router.post("/upload_bulk")
+def upload_documents_bulk(
+    files: list[UploadFile] = File(...),
+    current_admin: dict = Depends(security.get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Admin-only: upload many files and/or zip archives at once. Every accepted
+    file is streamed into the blob store and its document and ingestion job
+    are committed right away, which releases the blob's lock (see
+    app/blob_store.py); the ingestion workers process them in parallel.
+    Returns a status for every file.
+    """
+    company_id = current_admin["company_id"]
+    results = []
+    queued = 0
+
+    for filename, content_type, fileobj in _iter_bulk_sources(files):
+        if fileobj is None:
+            results.append({"filename": filename, "status": "rejected", "detail": "Not a valid zip archive."})
+            continue
+        ext = (filename or "").rsplit(".", 1)[-1].lower()
+        if ext not in SUPPORTED_EXTENSIONS:
+            results.append({"filename": filename, "status": "rejected", "detail": f"Unsupported file type '.{ext}'."})
+            continue
+        if queued >= BULK_UPLOAD_MAX_FILES:
+            results.append({"filename": filename, "status": "rejected", "detail": f"More than {BULK_UPLOAD_MAX_FILES} files."})
+            continue
+
+        try:
+            content_hash, file_size = blob_store.put_stream(fileobj, db=db)
+        except blob_store.BlobTooLarge as e:
+            results.append({"filename": filename, "status": "rejected", "detail": str(e)})
+            continue
+        if not file_size:
+            results.append({"filename": filename, "status": "rejected", "detail": "Empty file."})
+            continue
+
+        db_document = models.Document(
+            filename=filename,
+            content_type=content_type or "application/pdf",
+            file_size=file_size,
+            content_hash=content_hash,
+            company_id=company_id,
+            status=models.StatusEnum.processing,
+        )
+        db.add(db_document)
+        enqueue_ingestion_job(db, db_document)
+        # Flush assigns the id without the refresh reading it after the commit would cause
+        db.flush()
+        document_id = db_document.id
+        db.commit()
+        queued += 1
+        results.append({"filename": filename, "status": "queued", "document_id": document_id})
+
+    if queued:
+        answer_cache.invalidate(company_id)
+
+    return {
+        "message": f"{queued} of {len(results)} files queued for processing.",
+        "queued": queued,
+        "rejected": len(results) - queued,
+        "files": results,
+    }
+
 # -----------------------
 # Upload from URL endpoint
 # -----------------------
 @router.post("/upload_url")
-def upload_url_document(
-    background_tasks: BackgroundTasks,
+async def upload_url_document(
     url: str = Body(..., embed=True),
     current_admin: dict = Depends(security.get_current_admin_user),
     db: Session = Depends(get_db)
 ):
     """
-    Admin-only: fetch a document from URL, save it, and process it in background.
+    Admin-only: fetch a document from URL, save it, and queue it for the ingestion workers.
     """
     company_id = current_admin["company_id"]
 
-    # Fetch the file from URL
+    # Streamed into the blob store with a timeout and size limit, off the threadpool
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=400, detail=f"Failed to fetch URL: {e}")
+        result = await url_fetcher.fetch_to_blob(url, db=db)
+    except url_fetcher.FetchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    file_bytes = response.content
-    content_type = response.headers.get("Content-Type", "application/pdf")
-    if not file_bytes:
-        raise HTTPException(status_code=400, detail="URL returned empty content.")
+    def save(db: Session):
+        db_document = url_batches.create_url_document(db, company_id, result)
+        db.commit()
+        db.refresh(db_document)
+        return db_document
 
-    # Generate filename from URL
-    filename = url.split("/")[-1] or f"url_doc_{uuid.uuid4().hex}"
+    db_document = await asyncio.to_thread(save, db)
+    answer_cache.invalidate(company_id)
 
-    db_document = models.Document(
-        filename=filename,
-        content_type=content_type,
-        file_size=len(file_bytes),
-        file_data=file_bytes,
-        company_id=company_id,
-        status=models.StatusEnum.processing,
-        source_url=url
-    )
-    db.add(db_document)
-    db.commit()
-    db.refresh(db_document)
+    return {
+        "message": "URL content fetched and queued for processing.",
+        "document_id": db_document.id,
+        "filename": db_document.filename
+    }
 
-    temp_file_path = f"temp_{db_document.id}_{uuid.uuid4().hex}_{filename}"
-    with open(temp_file_path, "wb") as f:
-        f.write(file_bytes)
+# -----------------------
+# Bulk URL / sitemap ingestion
+# -----------------------
+@router.post("/upload_urls")
+def upload_url_batch(
+    request: schemas.UrlBatchCreate,
+    background_tasks: BackgroundTasks,
+    current_admin: dict = Depends(security.get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Admin-only: queue a list of URLs and/or every page of a sitemap. URLs are
+    fetched concurrently in the background; poll /documents/batches/{batch_id}
+    for progress.
+    """
+    company_id = current_admin["company_id"]
+    urls = [url.strip() for url in request.urls if url.strip()]
+    if not urls and not request.sitemap_url:
+        raise HTTPException(status_code=400, detail="Provide a list of URLs or a sitemap_url.")
+    if len(urls) > url_batches.URL_BATCH_MAX_URLS:
+        raise HTTPException(status_code=400, detail=f"At most {url_batches.URL_BATCH_MAX_URLS} URLs per batch.")
 
-    from ..processing import process_and_store_document
-    background_tasks.add_task(
-        process_and_store_document,
-        file_path=temp_file_path,
-        filename=filename,
-        company_id=company_id,
-        document_id=db_document.id
-    )
+    candidates = urls + ([request.sitemap_url] if request.sitemap_url else [])
+    invalid = [url for url in candidates if not url_fetcher.has_allowed_scheme(url)]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Only http(s) URLs are supported: {invalid}")
+
+    batch = url_batches.create_batch(db, company_id, urls, request.sitemap_url)
+    background_tasks.add_task(url_batches.run_batch, batch.id)
 
     return {
-        "message": "URL content fetched and processing started.",
-        "document_id": db_document.id,
-        "filename": filename
+        "message": "URL batch accepted for ingestion.",
+        "batch_id": batch.id,
+        "url_count": len(batch.items),
     }
 
+@router.get("/batches/{batch_id}")
+def get_url_batch(
+    batch_id: int,
+    current_admin: dict = Depends(security.get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Admin-only: fetch and ingestion progress of a URL batch.
+    """
+    batch = (
+        db.query(models.IngestionBatch)
+        .filter(models.IngestionBatch.id == batch_id, models.IngestionBatch.company_id == current_admin["company_id"])
+        .first()
+    )
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found or access denied.")
+    return url_batches.batch_progress(db, batch)
+
+# -----------------------
+# Refresh a URL document
+# -----------------------
+@router.post("/refresh/{document_id}")
+def refresh_url_document(
+    document_id: int,
+    current_admin: dict = Depends(security.get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Admin-only: re-fetch a URL document now. The ingestion worker sends a
+    conditional GET and re-embeds only chunks whose text changed.
+    """
+    company_id = current_admin["company_id"]
+    doc = (
+        db.query(models.Document)
+        .filter(models.Document.id == document_id, models.Document.company_id == company_id)
+        .first()
+    )
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found or access denied.")
+    if not doc.source_url:
+        raise HTTPException(status_code=400, detail="Only documents uploaded from a URL can be refreshed.")
+    if has_pending_job(db, doc.id):
+        raise HTTPException(status_code=409, detail="Document already has ingestion work queued.")
+
+    job = enqueue_ingestion_job(db, doc, kind=JOB_KIND_REFRESH)
+    db.commit()
+
+    return {"message": "Refresh queued.", "document_id": doc.id, "job_id": job.id}
+
 # -----------------------
 # Download endpoint
 # -----------------------
 @router.get("/download/{document_id}")
 def download_document(
     document_id: int,
+    request: Request,
     current_admin: dict = Depends(security.get_current_admin_user),
     db: Session = Depends(get_db)
 ):
+    """
+    Admin-only: streams the stored file. The ETag is the content hash, so
+    clients revalidate with If-None-Match and resume with Range requests.
+    """
     company_id = current_admin["company_id"]
     doc = (
         db.query(models.Document)
         .filter(models.Document.id == document_id, models.Document.company_id == company_id)
         .first()
     )
-    if not doc or not doc.file_data:
+    if not doc:
         raise HTTPException(status_code=404, detail="Document not found or no file stored.")
 
-    return Response(
-        content=doc.file_data,
+    if not blob_store.exists(doc.content_hash):
+        # Not yet moved out of the row by `python -m app.migrate_blobs`; move it now
+        db.refresh(doc, attribute_names=["file_data"])
+        if not doc.file_data:
+            raise HTTPException(status_code=404, detail="Document not found or no file stored.")
+        move_file_data_to_blob_store(doc)
+        db.commit()
+
+    etag = f'"{doc.content_hash}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    # FileResponse reads the blob in fixed-size chunks and answers Range /
+    # If-Range requests with 206 or 416 itself
+    return FileResponse(
+        blob_store.blob_path(doc.content_hash),
         media_type=doc.content_type or "application/pdf",
-        headers={
-            "Content-Disposition": f'attachment; filename="{doc.filename}"'
-        },
+        filename=doc.filename,
+        headers=headers,
     )
 
 # -----------------------
@@ -164,30 +333,106 @@ def download_document(
 # -----------------------
 @router.get("/")
 def list_documents(
+    request: Request,
     current_admin: dict = Depends(security.get_current_admin_user),
     db: Session = Depends(get_db)
 ):
     """
-    Admin-only: list all documents uploaded for the admin's company
+    Admin-only: list all documents uploaded for the admin's company.
+    Carries an ETag, so clients can revalidate a cached list with If-None-Match.
     """
     company_id = current_admin["company_id"]
     docs = db.query(models.Document).filter(models.Document.company_id == company_id).all()
 
-    if not docs:
-        return []
-
     # Return minimal info for frontend display, including content_type and source_url
-    return [
+    return json_response_with_etag(request, [
         {
             "id": d.id,
             "filename": d.filename,
             "status": d.status.value,
             "uploaded_at": d.uploaded_at,
             "content_type": d.content_type,
-            "source_url": getattr(d, 'source_url', None) # Safely get the new attribute
+            "file_size": d.file_size,
+            "source_url": getattr(d, 'source_url', None), # Safely get the new attribute
+            "ingestion_stage": d.ingestion_stage,
+            "ingestion_stats": d.ingestion_stats,
+            "error_message": d.error_message,
+            "processed_at": d.processed_at,
         }
         for d in docs
-    ]
+    ])
+
+# -----------------------
+# Live ingestion progress (server-sent events)
+# -----------------------
+def _progress_snapshot(d: models.Document) -> dict:
+    return {
+        "id": d.id,
+        "filename": d.filename,
+        "status": d.status.value,
+        "ingestion_stage": d.ingestion_stage,
+        "ingestion_stats": d.ingestion_stats,
+        "error_message": d.error_message,
+        "processed_at": d.processed_at.isoformat() if d.processed_at else None,
+    }
+
+
+def _load_progress(company_id: int, tracked_ids: set) -> list[dict]:
+    # Own short-lived session: the stream can stay open for minutes
+    db = SessionLocal()
+    try:
+        docs = (
+            db.query(models.Document)
+            .filter(
+                models.Document.company_id == company_id,
+                or_(models.Document.ingestion_stage.in_(IN_FLIGHT_STAGES), models.Document.id.in_(tracked_ids)),
+            )
+            .all()
+        )
+        return [_progress_snapshot(d) for d in docs]
+    finally:
+        db.close()
+
+
+@router.get("/progress/stream")
+async def stream_ingestion_progress(
+    request: Request,
+    current_admin: dict = Depends(security.get_current_admin_user),
+):
+    """
+    Admin-only: server-sent events with the ingestion progress of the
+    company's in-flight documents. A "progress" event is sent whenever a
+    document's stage, counts or error change; documents uploaded while the
+    stream is open are picked up. Once nothing is in flight an "idle" event
+    is sent and the stream ends.
+    """
+    company_id = current_admin["company_id"]
+
+    async def events():
+        last_sent = {}
+        tracked = set()
+        last_event_at = time.monotonic()
+        while not await request.is_disconnected():
+            snapshots = await asyncio.to_thread(_load_progress, company_id, tracked)
+            for snapshot in snapshots:
+                if last_sent.get(snapshot["id"]) != snapshot:
+                    last_sent[snapshot["id"]] = snapshot
+                    last_event_at = time.monotonic()
+                    yield f"event: progress\ndata: {json.dumps(snapshot)}\n\n"
+            tracked = {s["id"] for s in snapshots if s["ingestion_stage"] in IN_FLIGHT_STAGES}
+            if not tracked:
+                yield "event: idle\ndata: {}\n\n"
+                return
+            if time.monotonic() - last_event_at >= PROGRESS_HEARTBEAT_SECONDS:
+                last_event_at = time.monotonic()
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(PROGRESS_POLL_SECONDS)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # -----------------------
 # Delete document endpoint
@@ -209,11 +454,17 @@ def delete_document(
     if not db_document:
         raise HTTPException(status_code=404, detail="Document not found or access denied.")
 
+    content_hashes = (db_document.content_hash, db_document.pending_content_hash)
+
     # Delete from PostgreSQL
     db.delete(db_document)
     db.commit()
+    answer_cache.invalidate(company_id)
+
+    for content_hash in content_hashes:
+        blob_store.delete_if_unreferenced(db, content_hash)
 
     # Add background task to delete from ChromaDB
-    background_tasks.add_task(delete_document_from_chroma, document_id)
+    background_tasks.add_task(delete_document_from_chroma, document_id, company_id)
 
     return {"message": f"Document {document_id} and its embeddings are scheduled for deletion."}
\ No newline at end of file
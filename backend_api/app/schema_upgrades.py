@@ -0,0 +1,37 @@
+# backend_api/app/schema_upgrades.py
+#
+# create_all() only creates missing tables, it never adds columns to existing
+# ones. Columns added to existing models are listed here and applied with
+# idempotent DDL at startup.
+
+from sqlalchemy import text
+
+UPGRADES = [
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+    "CREATE INDEX IF NOT EXISTS ix_documents_content_hash ON documents (content_hash)",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS etag VARCHAR",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS last_modified VARCHAR",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS last_refreshed_at TIMESTAMP WITHOUT TIME ZONE",
+    "ALTER TABLE ingestion_jobs ADD COLUMN IF NOT EXISTS kind VARCHAR(16) NOT NULL DEFAULT 'ingest'",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS ingestion_stage VARCHAR(16)",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS ingestion_stats JSON",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS error_message TEXT",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS processed_at TIMESTAMP WITHOUT TIME ZONE",
+    "ALTER TABLE user_queries ADD COLUMN IF NOT EXISTS retrieved_chunk_ids JSON",
+    "ALTER TABLE user_queries ADD COLUMN IF NOT EXISTS stage_ms JSON",
+    "ALTER TABLE user_queries ADD COLUMN IF NOT EXISTS total_ms DOUBLE PRECISION",
+    "ALTER TABLE user_queries ADD COLUMN IF NOT EXISTS input_tokens INTEGER",
+    "ALTER TABLE user_queries ADD COLUMN IF NOT EXISTS output_tokens INTEGER",
+    "ALTER TABLE user_queries ADD COLUMN IF NOT EXISTS answer_cache_hit BOOLEAN DEFAULT FALSE",
+    "CREATE INDEX IF NOT EXISTS ix_user_queries_company_time ON user_queries (company_id, query_time)",
+    "ALTER TABLE ingestion_batches ADD COLUMN IF NOT EXISTS locked_by VARCHAR",
+    "ALTER TABLE ingestion_batches ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP WITHOUT TIME ZONE",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS pending_content_hash VARCHAR(64)",
+    "CREATE INDEX IF NOT EXISTS ix_documents_pending_content_hash ON documents (pending_content_hash)",
+]
+
+
+def upgrade_schema(engine):
+    with engine.begin() as conn:
+        for statement in UPGRADES:
+            conn.execute(text(statement))
@@ -33,6 +33,10 @@ class Document(DocumentBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+class UrlBatchCreate(BaseModel):
+    urls: list[str] = []
+    sitemap_url: str | None = None
+
 # --- Company Schemas ---
 class CompanyBase(BaseModel):
     name: str
@@ -61,5 +65,11 @@ class CompanyPublic(BaseModel):
 class ChatQuery(BaseModel):
     query: str
 
+class DroppedChunk(BaseModel):
+    id: str
+    filename: str | None = None
+    reason: str
+
 class ChatResponse(BaseModel):
-    answer: str
\ No newline at end of file
+    answer: str
+    dropped_chunks: list[DroppedChunk] = []
\ No newline at end of file
@@ -24,7 +24,7 @@ def hash_password(password: str) -> str:
 # --- JWT utilities ---
 def create_access_token(data: dict):
     """
-    Creates a JWT token including email, role, company_id, and name.
+    Creates a JWT token including email, user_id, role, company_id, and name.
     """
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -53,7 +53,9 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
             "email": email,
             "role": role,
             "company_id": company_id,
-            "name": name  # include name for frontend display
+            "name": name,  # include name for frontend display
+            # Tokens issued before user_id was added to the payload have none
+            "user_id": payload.get("user_id"),
         }
     except JWTError:
         raise credentials_exception
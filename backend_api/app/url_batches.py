@@ -0,0 +1,318 @@
+# backend_api/app/url_batches.py
+#
+# Bulk URL / sitemap ingestion. A batch is created by the API request, then
+# fetched on the event loop: every URL is streamed into the blob store by
+# app/url_fetcher.py and handed to the regular ingestion queue. Database work
+# runs in threads so the loop is never blocked.
+#
+# Every API process runs this, so a batch is owned by the process running it:
+# locked_by names the process and heartbeat_at is refreshed while it runs. Only
+# batches whose owner stopped sending heartbeats are resumed by another process.
+
+import os
+import socket
+import asyncio
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from . import models, url_fetcher
+from .database import SessionLocal
+from .jobs import enqueue_ingestion_job
+from .answer_cache import answer_cache
+
+load_dotenv()
+
+URL_BATCH_MAX_URLS = int(os.getenv("URL_BATCH_MAX_URLS", "1000"))
+# URLs of one batch being fetched at the same time (per-host limits still apply)
+URL_BATCH_CONCURRENCY = int(os.getenv("URL_BATCH_CONCURRENCY", "16"))
+# A running batch without a heartbeat for URL_BATCH_LOCK_TIMEOUT seconds is
+# assumed to belong to a stopped process; every process checks for such
+# batches that often and resumes them.
+URL_BATCH_HEARTBEAT_SECONDS = float(os.getenv("URL_BATCH_HEARTBEAT_SECONDS", "30"))
+URL_BATCH_LOCK_TIMEOUT = int(os.getenv("URL_BATCH_LOCK_TIMEOUT", "120"))
+
+# Identifies this API process in ingestion_batches.locked_by
+PROCESS_ID = f"{socket.gethostname()}-{os.getpid()}"
+
+# Keeps references to resumed batch tasks so they are not garbage collected
+_background_tasks = set()
+# Ids of the batches this process is running
+_running_batches = set()
+
+
+def create_url_document(db: Session, company_id: int, result: url_fetcher.FetchResult) -> models.Document:
+    """
+    Adds a document for a fetched URL together with its ingestion job.
+    The caller commits.
+    """
+    db_document = models.Document(
+        filename=result.filename,
+        content_type=result.content_type,
+        file_size=result.size,
+        content_hash=result.content_hash,
+        company_id=company_id,
+        status=models.StatusEnum.processing,
+        source_url=result.url,
+        etag=result.etag,
+        last_modified=result.last_modified,
+        last_refreshed_at=datetime.utcnow(),
+    )
+    db.add(db_document)
+    enqueue_ingestion_job(db, db_document)
+    return db_document
+
+
+def create_batch(db: Session, company_id: int, urls: list[str], sitemap_url: str | None) -> models.IngestionBatch:
+    batch = models.IngestionBatch(
+        company_id=company_id, sitemap_url=sitemap_url, locked_by=PROCESS_ID, heartbeat_at=datetime.utcnow()
+    )
+    batch.items = [models.IngestionBatchItem(url=url) for url in dict.fromkeys(urls)]
+    db.add(batch)
+    db.commit()
+    db.refresh(batch)
+    return batch
+
+
+def _in_session(fn, *args):
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+
+def _claim_batch(db: Session, batch_id: int) -> bool:
+    """
+    Takes ownership of a running batch unless another process holds it and
+    is still sending heartbeats. A single conditional UPDATE, so two
+    processes can never both claim the same batch.
+    """
+    stale_before = datetime.utcnow() - timedelta(seconds=URL_BATCH_LOCK_TIMEOUT)
+    claimed = (
+        db.query(models.IngestionBatch)
+        .filter(
+            models.IngestionBatch.id == batch_id,
+            models.IngestionBatch.status == models.BatchStatusEnum.running,
+            or_(
+                models.IngestionBatch.locked_by == PROCESS_ID,
+                models.IngestionBatch.locked_by.is_(None),
+                models.IngestionBatch.heartbeat_at.is_(None),
+                models.IngestionBatch.heartbeat_at < stale_before,
+            ),
+        )
+        .update({"locked_by": PROCESS_ID, "heartbeat_at": datetime.utcnow()}, synchronize_session=False)
+    )
+    db.commit()
+    return bool(claimed)
+
+
+def _touch_batch(db: Session, batch_id: int) -> bool:
+    touched = (
+        db.query(models.IngestionBatch)
+        .filter(models.IngestionBatch.id == batch_id, models.IngestionBatch.locked_by == PROCESS_ID)
+        .update({"heartbeat_at": datetime.utcnow()}, synchronize_session=False)
+    )
+    db.commit()
+    return bool(touched)
+
+
+async def _heartbeat(batch_id: int):
+    while True:
+        await asyncio.sleep(URL_BATCH_HEARTBEAT_SECONDS)
+        try:
+            if not await asyncio.to_thread(_in_session, _touch_batch, batch_id):
+                print(f"Batch {batch_id}: ownership was taken over by another process")
+                return
+        except Exception as e:
+            print(f"Batch {batch_id}: heartbeat failed: {e}")
+
+
+def _load_batch(db: Session, batch_id: int):
+    batch = db.get(models.IngestionBatch, batch_id)
+    has_items = db.query(models.IngestionBatchItem.id).filter(models.IngestionBatchItem.batch_id == batch_id).first()
+    return batch.company_id, batch.sitemap_url, has_items is not None
+
+
+def _add_items(db: Session, batch_id: int, urls: list[str]):
+    db.add_all([models.IngestionBatchItem(batch_id=batch_id, url=url) for url in urls])
+    db.commit()
+
+
+def _unfinished_items(db: Session, batch_id: int) -> list[tuple[int, str]]:
+    # "fetching" items are only left behind by a restart mid-batch
+    return (
+        db.query(models.IngestionBatchItem.id, models.IngestionBatchItem.url)
+        .filter(
+            models.IngestionBatchItem.batch_id == batch_id,
+            models.IngestionBatchItem.status.in_(
+                [models.BatchItemStatusEnum.pending, models.BatchItemStatusEnum.fetching]
+            ),
+        )
+        .order_by(models.IngestionBatchItem.id)
+        .all()
+    )
+
+
+def _set_item_status(db: Session, item_id: int, status: models.BatchItemStatusEnum, error: str | None = None):
+    item = db.get(models.IngestionBatchItem, item_id)
+    item.status = status
+    item.error = error
+    db.commit()
+
+
+def _queue_item(db: Session, item_id: int, company_id: int, result: url_fetcher.FetchResult):
+    # `db` holds the lock on the fetched blob (see app/blob_store.py) until this commit
+    item = db.get(models.IngestionBatchItem, item_id)
+    item.document = create_url_document(db, company_id, result)
+    item.status = models.BatchItemStatusEnum.queued
+    db.commit()
+
+
+def _finish_batch(db: Session, batch_id: int, status: models.BatchStatusEnum, error: str | None = None):
+    batch = db.get(models.IngestionBatch, batch_id)
+    batch.status = status
+    batch.error = error
+    batch.finished_at = datetime.utcnow()
+    batch.locked_by = None
+    db.commit()
+
+
+async def _fetch_item(item_id: int, url: str, company_id: int, limit: asyncio.Semaphore):
+    async with limit:
+        await asyncio.to_thread(_in_session, _set_item_status, item_id, models.BatchItemStatusEnum.fetching)
+        db = SessionLocal()
+        try:
+            result = await url_fetcher.fetch_to_blob(url, db=db)
+            await asyncio.to_thread(_queue_item, db, item_id, company_id, result)
+        except Exception as e:
+            print(f"Batch item {item_id} ({url}) failed: {e}")
+            await asyncio.to_thread(_in_session, _set_item_status, item_id, models.BatchItemStatusEnum.failed, str(e))
+        finally:
+            await asyncio.to_thread(db.close)
+
+
+async def run_batch(batch_id: int):
+    """
+    Expands the batch's sitemap (if any), then fetches every unfinished item
+    concurrently and queues the fetched documents for ingestion. Does nothing
+    if another live process owns the batch.
+    """
+    if batch_id in _running_batches:
+        return
+    _running_batches.add(batch_id)
+    try:
+        if not await asyncio.to_thread(_in_session, _claim_batch, batch_id):
+            print(f"Batch {batch_id}: already running in another process")
+            return
+        heartbeat = asyncio.create_task(_heartbeat(batch_id))
+        try:
+            await _run_claimed_batch(batch_id)
+        finally:
+            heartbeat.cancel()
+    finally:
+        _running_batches.discard(batch_id)
+
+
+async def _run_claimed_batch(batch_id: int):
+    try:
+        company_id, sitemap_url, has_items = await asyncio.to_thread(_in_session, _load_batch, batch_id)
+
+        if sitemap_url and not has_items:
+            urls = await url_fetcher.expand_sitemap(sitemap_url)
+            if len(urls) > URL_BATCH_MAX_URLS:
+                print(f"Batch {batch_id}: sitemap lists {len(urls)} URLs, keeping the first {URL_BATCH_MAX_URLS}")
+                urls = urls[:URL_BATCH_MAX_URLS]
+            await asyncio.to_thread(_in_session, _add_items, batch_id, urls)
+
+        items = await asyncio.to_thread(_in_session, _unfinished_items, batch_id)
+        print(f"Batch {batch_id}: fetching {len(items)} URLs for company_id {company_id}")
+
+        limit = asyncio.Semaphore(URL_BATCH_CONCURRENCY)
+        await asyncio.gather(*(_fetch_item(item_id, url, company_id, limit) for item_id, url in items))
+
+        await asyncio.to_thread(_in_session, _finish_batch, batch_id, models.BatchStatusEnum.completed)
+        answer_cache.invalidate(company_id)
+        print(f"Batch {batch_id}: all URLs fetched")
+    except Exception as e:
+        print(f"Batch {batch_id} failed: {e}")
+        await asyncio.to_thread(_in_session, _finish_batch, batch_id, models.BatchStatusEnum.failed, str(e))
+
+
+async def resume_unfinished_batches():
+    """
+    Restarts running batches whose process stopped sending heartbeats (or
+    that predate ownership). run_batch claims each one first, so a batch
+    seen by several processes at once is resumed by only one of them.
+    """
+    def orphaned_batch_ids(db: Session):
+        stale_before = datetime.utcnow() - timedelta(seconds=URL_BATCH_LOCK_TIMEOUT)
+        return [
+            batch_id
+            for (batch_id,) in db.query(models.IngestionBatch.id)
+            .filter(
+                models.IngestionBatch.status == models.BatchStatusEnum.running,
+                or_(
+                    models.IngestionBatch.locked_by.is_(None),
+                    models.IngestionBatch.heartbeat_at.is_(None),
+                    models.IngestionBatch.heartbeat_at < stale_before,
+                ),
+            )
+            .all()
+        ]
+
+    for batch_id in await asyncio.to_thread(_in_session, orphaned_batch_ids):
+        print(f"Resuming URL batch {batch_id}")
+        task = asyncio.create_task(run_batch(batch_id))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+
+async def watch_unfinished_batches():
+    """
+    Resumes orphaned batches at startup and then every URL_BATCH_LOCK_TIMEOUT
+    seconds, so a batch left by a crashed process is picked up by a survivor.
+    Runs until cancelled.
+    """
+    while True:
+        try:
+            await resume_unfinished_batches()
+        except Exception as e:
+            print(f"Failed to resume URL batches: {e}")
+        await asyncio.sleep(URL_BATCH_LOCK_TIMEOUT)
+
+
+def batch_progress(db: Session, batch: models.IngestionBatch) -> dict:
+    """
+    Fetch status of every URL in the batch plus the ingestion status of the
+    documents created from them.
+    """
+    items = []
+    counts = {status.value: 0 for status in models.BatchItemStatusEnum}
+    ingestion = {status.value: 0 for status in models.StatusEnum}
+    for item in batch.items:
+        counts[item.status.value] += 1
+        document_status = item.document.status.value if item.document else None
+        if document_status:
+            ingestion[document_status] += 1
+        items.append({
+            "id": item.id,
+            "url": item.url,
+            "status": item.status.value,
+            "error": item.error,
+            "document_id": item.document_id,
+            "document_status": document_status,
+        })
+
+    return {
+        "batch_id": batch.id,
+        "status": batch.status.value,
+        "sitemap_url": batch.sitemap_url,
+        "error": batch.error,
+        "created_at": batch.created_at,
+        "finished_at": batch.finished_at,
+        "total": len(items),
+        "fetch_counts": counts,
+        "ingestion_counts": ingestion,
+        "items": items,
+    }
@@ -0,0 +1,329 @@
+# backend_api/app/url_fetcher.py
+#
+# Async HTTP fetching for URL ingestion. Bodies are streamed straight into the
+# blob store, every request has a timeout and a size limit, and a per-host
+# semaphore keeps bulk imports from hammering a single site.
+#
+# URLs come from users, sitemaps and redirects, so every request (each
+# redirect hop included) is checked before it is sent: only http(s), and
+# unless URL_FETCH_ALLOW_PRIVATE is set, only hosts that resolve to public
+# addresses. This keeps the server from being used to reach internal services.
+
+import os
+import uuid
+import socket
+import asyncio
+import ipaddress
+import posixpath
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from urllib.parse import urlparse, unquote
+import xml.etree.ElementTree as ET
+import httpx
+from dotenv import load_dotenv
+from . import blob_store
+
+load_dotenv()
+
+# --- Fetch settings ---
+URL_FETCH_TIMEOUT = float(os.getenv("URL_FETCH_TIMEOUT", "30"))
+URL_FETCH_CONNECT_TIMEOUT = float(os.getenv("URL_FETCH_CONNECT_TIMEOUT", "10"))
+# Concurrent requests per host, and overall across all hosts
+URL_FETCH_PER_HOST_LIMIT = int(os.getenv("URL_FETCH_PER_HOST_LIMIT", "4"))
+URL_FETCH_MAX_CONNECTIONS = int(os.getenv("URL_FETCH_MAX_CONNECTIONS", "50"))
+URL_FETCH_MAX_BYTES = int(os.getenv("URL_FETCH_MAX_BYTES", str(blob_store.MAX_UPLOAD_BYTES)))
+# Sitemaps only list URLs, so they get a much smaller limit
+SITEMAP_MAX_BYTES = int(os.getenv("SITEMAP_MAX_BYTES", str(10 * 1024 * 1024)))
+SITEMAP_MAX_DEPTH = 2
+# Allows fetching from private, loopback and link-local addresses (e.g. an intranet wiki)
+URL_FETCH_ALLOW_PRIVATE = os.getenv("URL_FETCH_ALLOW_PRIVATE", "false").lower() in ("1", "true", "yes")
+ALLOWED_SCHEMES = ("http", "https")
+
+USER_AGENT = "CompanyChatbotIngest/1.0"
+
+# Extensions the ingestion pipeline understands, by content type
+_EXTENSIONS = {
+    "application/pdf": "pdf",
+    "text/html": "html",
+    "application/xhtml+xml": "html",
+    "text/plain": "txt",
+}
+
+_client = None
+_sync_client = None
+# host -> [semaphore, fetches waiting or running]; dropped when the count reaches 0
+_host_semaphores = {}
+
+
+class FetchError(Exception):
+    pass
+
+
+@dataclass
+class FetchResult:
+    url: str
+    filename: str
+    content_type: str
+    content_hash: str
+    size: int
+    etag: str | None = None
+    last_modified: str | None = None
+
+
+def has_allowed_scheme(url: str) -> bool:
+    parsed = urlparse(url)
+    return parsed.scheme.lower() in ALLOWED_SCHEMES and bool(parsed.netloc)
+
+
+def _check_addresses(host: str, addresses):
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split("%", 1)[0])
+        if not address.is_global:
+            raise FetchError(f"Refusing to fetch from {host}: it resolves to a non-public address ({address}).")
+
+
+def _check_scheme(request: httpx.Request):
+    if request.url.scheme not in ALLOWED_SCHEMES:
+        raise FetchError(f"Only http(s) URLs are supported: {request.url}")
+
+
+def _port(request: httpx.Request) -> int:
+    return request.url.port or (443 if request.url.scheme == "https" else 80)
+
+
+async def _check_request(request: httpx.Request):
+    """
+    Request hook of the async client, run for the first request and for
+    every redirect hop.
+    """
+    _check_scheme(request)
+    if URL_FETCH_ALLOW_PRIVATE:
+        return
+    host = request.url.host
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(host, _port(request), type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise FetchError(f"Could not resolve {host}: {e}")
+    _check_addresses(host, addresses)
+
+
+def _check_request_sync(request: httpx.Request):
+    """Request hook of the blocking client, like _check_request."""
+    _check_scheme(request)
+    if URL_FETCH_ALLOW_PRIVATE:
+        return
+    host = request.url.host
+    try:
+        addresses = socket.getaddrinfo(host, _port(request), type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise FetchError(f"Could not resolve {host}: {e}")
+    _check_addresses(host, addresses)
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            follow_redirects=True,
+            event_hooks={"request": [_check_request]},
+            headers={"User-Agent": USER_AGENT},
+            limits=httpx.Limits(max_connections=URL_FETCH_MAX_CONNECTIONS, max_keepalive_connections=20),
+            timeout=httpx.Timeout(URL_FETCH_TIMEOUT, connect=URL_FETCH_CONNECT_TIMEOUT),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+@asynccontextmanager
+async def _host_slot(url: str):
+    """
+    Holds one of the URL_FETCH_PER_HOST_LIMIT slots of the URL's host. A host's
+    semaphore only exists while it has fetches waiting or running.
+    """
+    host = urlparse(url).netloc.lower()
+    entry = _host_semaphores.setdefault(host, [asyncio.Semaphore(URL_FETCH_PER_HOST_LIMIT), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _host_semaphores[host]
+
+
+def filename_from_url(url: str, content_type: str) -> str:
+    """
+    Last path segment of the URL. An extension matching the content type is
+    appended when missing, since ingestion picks the parser by extension.
+    """
+    name = unquote(posixpath.basename(urlparse(url).path)) or f"url_doc_{uuid.uuid4().hex}"
+    ext = _EXTENSIONS.get(content_type.split(";")[0].strip().lower())
+    if ext and name.rsplit(".", 1)[-1].lower() not in (ext, "htm"):
+        name = f"{name}.{ext}"
+    return name
+
+
+def _check_declared_size(response: httpx.Response, max_bytes: int):
+    declared = response.headers.get("Content-Length")
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise FetchError(f"Response of {declared} bytes exceeds the limit of {max_bytes} bytes.")
+
+
+def _fetch_result(url: str, headers, content_hash: str | None, size: int) -> FetchResult:
+    if not size:
+        raise FetchError("URL returned empty content.")
+    content_type = headers.get("Content-Type", "application/pdf")
+    return FetchResult(
+        url=url,
+        filename=filename_from_url(url, content_type),
+        content_type=content_type,
+        content_hash=content_hash,
+        size=size,
+        etag=headers.get("ETag"),
+        last_modified=headers.get("Last-Modified"),
+    )
+
+
+async def _stream_to_blob(response: httpx.Response, max_bytes: int, db=None):
+    _check_declared_size(response, max_bytes)
+    writer = blob_store.BlobWriter(max_bytes)
+    try:
+        async for chunk in response.aiter_bytes(blob_store.STREAM_CHUNK_SIZE):
+            writer.write(chunk)
+    except blob_store.BlobTooLarge as e:
+        writer.abort()
+        raise FetchError(str(e))
+    except BaseException:
+        writer.abort()
+        raise
+    # With a session this waits for the blob's lock, so it runs in a thread
+    return await asyncio.to_thread(writer.commit, db)
+
+
+async def fetch_to_blob(url: str, max_bytes: int = URL_FETCH_MAX_BYTES, db=None) -> FetchResult:
+    """
+    Downloads `url` into the blob store. Raises FetchError on HTTP errors,
+    timeouts, empty bodies and bodies larger than `max_bytes`. Pass the
+    session that will reference the blob as `db` (see app/blob_store.py).
+    """
+    try:
+        async with _host_slot(url):
+            async with get_client().stream("GET", url) as response:
+                response.raise_for_status()
+                content_hash, size = await _stream_to_blob(response, max_bytes, db)
+                headers = response.headers
+    except httpx.HTTPError as e:
+        raise FetchError(f"Failed to fetch URL: {e}")
+    return _fetch_result(url, headers, content_hash, size)
+
+
+def _conditional_headers(etag: str | None, last_modified: str | None) -> dict:
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+
+def get_sync_client() -> httpx.Client:
+    """
+    Blocking client for the ingestion worker's threads, which have no event loop.
+    """
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = httpx.Client(
+            follow_redirects=True,
+            event_hooks={"request": [_check_request_sync]},
+            headers={"User-Agent": USER_AGENT},
+            timeout=httpx.Timeout(URL_FETCH_TIMEOUT, connect=URL_FETCH_CONNECT_TIMEOUT),
+        )
+    return _sync_client
+
+
+def fetch_if_modified(
+    url: str, etag: str | None, last_modified: str | None, max_bytes: int = URL_FETCH_MAX_BYTES, db=None
+) -> FetchResult | None:
+    """
+    Conditional GET used by URL refreshes. Returns None when the server
+    answers 304 Not Modified, otherwise streams the new body into the blob
+    store like fetch_to_blob.
+    """
+    try:
+        with get_sync_client().stream("GET", url, headers=_conditional_headers(etag, last_modified)) as response:
+            if response.status_code == 304:
+                return None
+            response.raise_for_status()
+            _check_declared_size(response, max_bytes)
+            writer = blob_store.BlobWriter(max_bytes)
+            try:
+                for chunk in response.iter_bytes(blob_store.STREAM_CHUNK_SIZE):
+                    writer.write(chunk)
+            except blob_store.BlobTooLarge as e:
+                writer.abort()
+                raise FetchError(str(e))
+            except BaseException:
+                writer.abort()
+                raise
+            content_hash, size = writer.commit(db)
+            headers = response.headers
+    except httpx.HTTPError as e:
+        raise FetchError(f"Failed to fetch URL: {e}")
+    return _fetch_result(url, headers, content_hash, size)
+
+
+async def _fetch_small(url: str, max_bytes: int) -> bytes:
+    body = bytearray()
+    try:
+        async with _host_slot(url):
+            async with get_client().stream("GET", url) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes():
+                    body.extend(chunk)
+                    if len(body) > max_bytes:
+                        raise FetchError(f"Sitemap exceeds the limit of {max_bytes} bytes.")
+    except httpx.HTTPError as e:
+        raise FetchError(f"Failed to fetch sitemap: {e}")
+    return bytes(body)
+
+
+async def expand_sitemap(sitemap_url: str, depth: int = 0) -> list[str]:
+    """
+    Returns the page URLs listed in a sitemap, following sitemap indexes
+    up to SITEMAP_MAX_DEPTH levels. Order is preserved and duplicates dropped.
+    """
+    try:
+        root = ET.fromstring(await _fetch_small(sitemap_url, SITEMAP_MAX_BYTES))
+    except ET.ParseError as e:
+        raise FetchError(f"Invalid sitemap XML: {e}")
+
+    # Tags are namespaced ({http://www.sitemaps.org/...}loc); match on the local name
+    locs = [el.text.strip() for el in root.iter() if el.tag.rsplit("}", 1)[-1] == "loc" and el.text]
+    # Sitemaps are third-party input; addresses are checked again when each URL is fetched
+    rejected = [loc for loc in locs if not has_allowed_scheme(loc)]
+    if rejected:
+        print(f"Sitemap {sitemap_url}: skipping {len(rejected)} non-http(s) URLs, e.g. {rejected[0]}")
+        locs = [loc for loc in locs if has_allowed_scheme(loc)]
+
+    if root.tag.rsplit("}", 1)[-1] != "sitemapindex":
+        return list(dict.fromkeys(locs))
+    if depth >= SITEMAP_MAX_DEPTH:
+        raise FetchError("Sitemap indexes are nested too deeply.")
+
+    urls = []
+    nested = await asyncio.gather(*(expand_sitemap(loc, depth + 1) for loc in locs), return_exceptions=True)
+    for loc, result in zip(locs, nested):
+        if isinstance(result, FetchError):
+            print(f"Skipping nested sitemap {loc}: {result}")
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            urls.extend(result)
+    return list(dict.fromkeys(urls))
@@ -0,0 +1,75 @@
+# backend_api/app/url_refresh.py
+#
+# Incremental re-ingestion of URL documents. The page is re-fetched with the
+# validators from the previous fetch; unchanged pages cost one 304 and no
+# embed calls, and changed pages only add and delete the chunks whose text
+# changed (see process_and_store_document(incremental=True)).
+
+from datetime import datetime
+from sqlalchemy.orm import Session
+from . import blob_store, models, url_fetcher
+from .processing import process_and_store_document
+
+
+def refresh_url_document(db: Session, document: models.Document) -> dict:
+    """
+    Re-fetches `document.source_url` and applies the changes, if any.
+    Raises on fetch or processing errors so the job is retried.
+
+    A changed page's blob is recorded as the document's pending_content_hash
+    and committed before it is processed, which releases the blob's lock
+    (see app/blob_store.py) while keeping the blob referenced. It replaces
+    content_hash once processing succeeds and is deleted if processing fails.
+    """
+    # The session holds the new blob's lock until the document references it
+    result = url_fetcher.fetch_if_modified(document.source_url, document.etag, document.last_modified, db=db)
+    document.last_refreshed_at = datetime.utcnow()
+    # Left behind by a refresh whose worker died mid-way
+    abandoned_hash = document.pending_content_hash
+
+    if result is None or result.content_hash == document.content_hash:
+        if result is not None:
+            # Server without validators (or new ones): remember them for next time
+            document.etag, document.last_modified = result.etag, result.last_modified
+        document.pending_content_hash = None
+        document.ingestion_stage = "completed"
+        document.error_message = None
+        db.commit()
+        blob_store.delete_if_unreferenced(db, abandoned_hash)
+        print(f"Document {document.id} ({document.source_url}) is unchanged.")
+        return {"modified": False}
+
+    document_id, filename, company_id = document.id, document.filename, document.company_id
+    document.pending_content_hash = result.content_hash
+    db.commit()
+    if abandoned_hash != result.content_hash:
+        blob_store.delete_if_unreferenced(db, abandoned_hash)
+
+    try:
+        stats = process_and_store_document(
+            file_path=blob_store.blob_path(result.content_hash),
+            filename=filename,
+            company_id=company_id,
+            document_id=document_id,
+            incremental=True,
+        )
+    except Exception:
+        # The document still points at its previous blob; don't keep the new one around
+        db.rollback()
+        db.query(models.Document).filter(
+            models.Document.id == document_id, models.Document.pending_content_hash == result.content_hash
+        ).update({"pending_content_hash": None}, synchronize_session=False)
+        db.commit()
+        blob_store.delete_if_unreferenced(db, result.content_hash)
+        raise
+
+    previous_hash = document.content_hash
+    document.content_hash = result.content_hash
+    document.pending_content_hash = None
+    document.file_size = result.size
+    document.content_type = result.content_type
+    document.etag, document.last_modified = result.etag, result.last_modified
+    db.commit()
+    blob_store.delete_if_unreferenced(db, previous_hash)
+
+    return dict(stats, modified=True)
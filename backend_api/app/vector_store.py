@@ -0,0 +1,153 @@
+# backend_api/app/vector_store.py
+
+import os
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Configuration ---
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "chroma")
+# Ingestion workers run in their own processes, so in deployments they and the
+# API share a Chroma server (CHROMA_HOST). Without it an embedded on-disk store is used.
+CHROMA_HOST = os.getenv("CHROMA_HOST")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+CHROMA_PATH = os.getenv("CHROMA_PATH", "chroma_db")
+
+# The old shared collection, kept only as the source for `python -m app.migrate_collections`.
+LEGACY_COLLECTION_NAME = "company_documents"
+
+
+class VectorStore:
+    """
+    Interface every vector-store backend implements. Vectors are partitioned
+    per company; callers never see backend-specific clients or collections.
+    """
+
+    def add(self, company_id: int, ids: list[str], embeddings: list, metadatas: list[dict]):
+        """Adds (or replaces) chunks in the company's partition."""
+        raise NotImplementedError
+
+    def query(self, company_id: int, query_embeddings: list, n_results: int) -> dict:
+        """Returns the nearest chunks as {"ids", "distances", "metadatas"}, one list per query embedding."""
+        raise NotImplementedError
+
+    def delete(self, company_id: int, ids: list[str] | None = None, where: dict | None = None):
+        """Deletes chunks by id and/or metadata filter from the company's partition."""
+        raise NotImplementedError
+
+    def count(self, company_id: int) -> int:
+        """Number of chunks stored for the company."""
+        raise NotImplementedError
+
+    def get_ids(self, company_id: int, where: dict | None = None) -> list[str]:
+        """Ids of the company's chunks, optionally filtered by metadata."""
+        raise NotImplementedError
+
+
+class ChromaVectorStore(VectorStore):
+    """
+    Chroma backend with one collection per company. The client and collections
+    are created lazily on first use; creation is guarded by a lock so concurrent
+    requests and ingestion threads share a single client.
+    """
+
+    def __init__(self, host: str | None = CHROMA_HOST, port: int = CHROMA_PORT, path: str = CHROMA_PATH):
+        self.host = host
+        self.port = port
+        self.path = path
+        self._client = None
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import chromadb
+                    if self.host:
+                        self._client = chromadb.HttpClient(host=self.host, port=self.port)
+                    else:
+                        self._client = chromadb.PersistentClient(path=self.path)
+        return self._client
+
+    @staticmethod
+    def collection_name(company_id: int) -> str:
+        return f"company_{company_id}_documents"
+
+    def collection(self, company_id: int):
+        """
+        Returns the company's collection, creating it on first use.
+        """
+        collection = self._collections.get(company_id)
+        if collection is None:
+            client = self.client
+            with self._lock:
+                collection = self._collections.get(company_id)
+                if collection is None:
+                    collection = client.get_or_create_collection(name=self.collection_name(company_id))
+                    self._collections[company_id] = collection
+        return collection
+
+    def add(self, company_id, ids, embeddings, metadatas):
+        # upsert keeps retried ingestion jobs idempotent
+        self.collection(company_id).upsert(ids=ids, embeddings=embeddings, metadatas=metadatas)
+
+    def query(self, company_id, query_embeddings, n_results):
+        return self.collection(company_id).query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            include=["metadatas", "distances"],
+        )
+
+    def delete(self, company_id, ids=None, where=None):
+        self.collection(company_id).delete(ids=ids, where=where)
+
+    def count(self, company_id):
+        return self.collection(company_id).count()
+
+    def get_ids(self, company_id, where=None):
+        return self.collection(company_id).get(where=where, include=[])["ids"]
+
+    def legacy_collection(self):
+        """
+        The pre-partitioning shared collection, or None if it does not exist.
+        """
+        try:
+            return self.client.get_collection(name=LEGACY_COLLECTION_NAME)
+        except Exception:
+            return None
+
+    def drop_legacy_collection(self):
+        self.client.delete_collection(name=LEGACY_COLLECTION_NAME)
+
+
+# --- Backend registry ---
+_BACKENDS = {
+    "chroma": ChromaVectorStore,
+}
+_store = None
+_store_lock = threading.Lock()
+
+
+def register_backend(name: str, factory):
+    """
+    Makes a VectorStore implementation selectable via VECTOR_STORE_BACKEND.
+    """
+    _BACKENDS[name] = factory
+
+
+def get_vector_store() -> VectorStore:
+    """
+    Returns the process-wide vector store, creating it on first use.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if VECTOR_STORE_BACKEND not in _BACKENDS:
+                    raise ValueError(f"Unknown VECTOR_STORE_BACKEND: {VECTOR_STORE_BACKEND}")
+                _store = _BACKENDS[VECTOR_STORE_BACKEND]()
+                print(f"Vector store initialized with backend: {VECTOR_STORE_BACKEND}")
+    return _store
@@ -0,0 +1,251 @@
+# backend_api/app/worker.py
+#
+# Ingestion worker pool. Run it as a separate process next to the API:
+#
+#     python -m app.worker
+#
+# INGEST_WORKER_CONCURRENCY controls how many worker processes claim jobs in parallel,
+# INGEST_JOBS_PER_WORKER how many jobs each process runs at once. Jobs inside one
+# process share the embedding batcher, so their chunks go out in full batches.
+
+import os
+import signal
+import socket
+import traceback
+import threading
+import multiprocessing
+from dotenv import load_dotenv
+
+load_dotenv()
+
+INGEST_WORKER_CONCURRENCY = int(os.getenv("INGEST_WORKER_CONCURRENCY", "2"))
+INGEST_JOBS_PER_WORKER = int(os.getenv("INGEST_JOBS_PER_WORKER", "4"))
+INGEST_POLL_INTERVAL = float(os.getenv("INGEST_POLL_INTERVAL", "2"))
+# URL documents are re-fetched (conditional GET) this often; 0 disables scheduled refreshes
+URL_REFRESH_INTERVAL_SECONDS = float(os.getenv("URL_REFRESH_INTERVAL_SECONDS", "86400"))
+URL_REFRESH_CHECK_SECONDS = float(os.getenv("URL_REFRESH_CHECK_SECONDS", "300"))
+# Prometheus metrics of all worker processes are served on this port; 0 disables it
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+WORKER_METRICS_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "/tmp/ingest_worker_metrics")
+
+
+def run_job(db, job):
+    """
+    Runs the ingestion pipeline directly on the document's blob, or for
+    refresh jobs re-fetches the document's URL and applies only what changed.
+    Raises on failure so the job is retried, and DocumentDeleted if the
+    document is gone.
+    """
+    from . import blob_store, models
+    from .jobs import JOB_KIND_REFRESH
+    from .migrate_blobs import move_file_data_to_blob_store
+    from .processing import DocumentDeleted, process_and_store_document
+    from .url_refresh import refresh_url_document
+
+    document = db.get(models.Document, job.document_id)
+    if document is None:
+        raise DocumentDeleted(f"Document {job.document_id} no longer exists.")
+
+    if not document.content_hash:
+        # Uploaded before the blob store existed: move its bytes out of the row first
+        db.refresh(document, attribute_names=["file_data"])
+        if not document.file_data:
+            print(f"Job {job.id}: document {job.document_id} has no stored file, skipping.")
+            return
+        move_file_data_to_blob_store(document)
+        db.commit()
+
+    if job.kind == JOB_KIND_REFRESH:
+        refresh_url_document(db, document)
+        return
+
+    process_and_store_document(
+        file_path=blob_store.blob_path(document.content_hash),
+        filename=document.filename,
+        company_id=document.company_id,
+        document_id=document.id,
+    )
+
+
+def heartbeat_loop(job_id: int, worker_id: str, done: threading.Event):
+    """
+    Keeps the claim on a running job fresh until `done` is set, however long
+    the job takes.
+    """
+    from .database import SessionLocal
+    from .jobs import INGEST_JOB_HEARTBEAT_SECONDS, touch_job
+
+    while not done.wait(INGEST_JOB_HEARTBEAT_SECONDS):
+        db = SessionLocal()
+        try:
+            touch_job(db, job_id, worker_id)
+        except Exception as e:
+            print(f"Heartbeat for job {job_id} failed: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+
+def job_loop(worker_id: str, stop_event):
+    from .database import SessionLocal
+    from .jobs import claim_next_job, mark_job_failed, mark_job_succeeded
+    from .metrics import INGESTION_JOBS
+    from .processing import DocumentDeleted
+
+    while not stop_event.is_set():
+        db = SessionLocal()
+        try:
+            job = claim_next_job(db, worker_id)
+            if job is None:
+                stop_event.wait(INGEST_POLL_INTERVAL)
+                continue
+
+            print(f"Worker {worker_id} running job {job.id} (attempt {job.attempts}/{job.max_attempts})")
+            done = threading.Event()
+            heartbeat = threading.Thread(
+                target=heartbeat_loop, args=(job.id, worker_id, done), name=f"heartbeat-{job.id}", daemon=True
+            )
+            heartbeat.start()
+            try:
+                run_job(db, job)
+            except DocumentDeleted as e:
+                # Deleting the document also deleted this job row; there is nothing to record
+                db.rollback()
+                INGESTION_JOBS.labels(job.kind, "cancelled").inc()
+                print(f"Job {job.id} cancelled: {e}")
+            except Exception as e:
+                traceback.print_exc()
+                db.rollback()
+                mark_job_failed(db, job, f"{type(e).__name__}: {e}")
+                INGESTION_JOBS.labels(job.kind, "failed").inc()
+                print(f"Job {job.id} failed: {e}")
+            else:
+                mark_job_succeeded(db, job)
+                INGESTION_JOBS.labels(job.kind, "succeeded").inc()
+                print(f"Job {job.id} completed.")
+            finally:
+                done.set()
+        except Exception as e:
+            # Database hiccups should not kill the worker
+            print(f"Worker {worker_id} error: {e}")
+            db.rollback()
+            stop_event.wait(INGEST_POLL_INTERVAL)
+        finally:
+            db.close()
+
+
+def refresh_scheduler_loop(stop_event):
+    """
+    Periodically queues refresh jobs for URL documents that are due.
+    """
+    from .database import SessionLocal
+    from .jobs import enqueue_due_refreshes
+
+    while not stop_event.is_set():
+        db = SessionLocal()
+        try:
+            queued = enqueue_due_refreshes(db, URL_REFRESH_INTERVAL_SECONDS)
+            if queued:
+                print(f"Queued {queued} URL refresh job(s).")
+        except Exception as e:
+            print(f"Refresh scheduler error: {e}")
+            db.rollback()
+        finally:
+            db.close()
+        stop_event.wait(URL_REFRESH_CHECK_SECONDS)
+
+
+def worker_loop(worker_id: str, stop_event):
+    # The parent handles shutdown signals; children finish their current jobs.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    print(f"Ingestion worker {worker_id} started with {INGEST_JOBS_PER_WORKER} job slot(s).")
+
+    threads = [
+        threading.Thread(target=job_loop, args=(f"{worker_id}.{slot}", stop_event), name=f"ingest-{slot}")
+        for slot in range(INGEST_JOBS_PER_WORKER)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"Ingestion worker {worker_id} stopped.")
+
+
+def start_metrics_server():
+    """
+    Serves the metrics of all worker processes on WORKER_METRICS_PORT. Must run
+    before the workers start: in multiprocess mode every process writes its
+    metrics to files in PROMETHEUS_MULTIPROC_DIR, which the server sums up.
+    """
+    import shutil
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = WORKER_METRICS_DIR
+    # Files left by a previous run would be added to this run's counters
+    shutil.rmtree(WORKER_METRICS_DIR, ignore_errors=True)
+    os.makedirs(WORKER_METRICS_DIR)
+
+    from prometheus_client import CollectorRegistry, start_http_server, multiprocess
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    start_http_server(WORKER_METRICS_PORT, registry=registry)
+    print(f"Serving worker metrics on port {WORKER_METRICS_PORT}.")
+
+
+def main():
+    if WORKER_METRICS_PORT:
+        start_metrics_server()
+
+    from . import models
+    from .database import engine
+    from .schema_upgrades import upgrade_schema
+
+    models.Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
+
+    # "spawn" gives every worker fresh DB/Chroma/Cohere clients instead of
+    # sharing connections inherited from the parent.
+    ctx = multiprocessing.get_context("spawn")
+    stop_event = ctx.Event()
+
+    def request_stop(signum, frame):
+        print("Shutting down ingestion workers after their current jobs...")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    host = socket.gethostname()
+    processes = [
+        ctx.Process(target=worker_loop, args=(f"{host}-{os.getpid()}-{i}", stop_event), daemon=False)
+        for i in range(INGEST_WORKER_CONCURRENCY)
+    ]
+    for process in processes:
+        process.start()
+    print(f"Started {len(processes)} ingestion worker(s).")
+
+    if URL_REFRESH_INTERVAL_SECONDS > 0:
+        scheduler = threading.Thread(target=refresh_scheduler_loop, args=(stop_event,), name="url-refresh", daemon=True)
+        scheduler.start()
+
+    # Restart workers that die unexpectedly
+    while not stop_event.is_set():
+        for i, process in enumerate(processes):
+            if not process.is_alive() and not stop_event.is_set():
+                print(f"Ingestion worker {i} exited with code {process.exitcode}, restarting.")
+                if WORKER_METRICS_PORT:
+                    from prometheus_client import multiprocess
+                    multiprocess.mark_process_dead(process.pid)
+                processes[i] = ctx.Process(
+                    target=worker_loop, args=(f"{host}-{os.getpid()}-{i}", stop_event), daemon=False
+                )
+                processes[i].start()
+        stop_event.wait(5)
+
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
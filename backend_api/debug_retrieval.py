@@ -20,7 +20,7 @@ def test_retrieval(test_query: str, company_id_to_test: int):
 
     co = cohere.Client(COHERE_API_KEY)
     db_client = chromadb.Client()
-    collection = db_client.get_or_create_collection(name="company_documents")
+    collection = db_client.get_or_create_collection(name=f"company_{company_id_to_test}_documents")
 
     print(f"Testing for Company ID: {company_id_to_test}")
     print(f"Using test query: '{test_query}'")
@@ -37,11 +37,10 @@ def test_retrieval(test_query: str, company_id_to_test: int):
         print(f"ERROR: Failed to embed query. {e}")
         return
 
-    # 3. Query the collection with the company_id filter
+    # 3. Query the company's own collection
     results = collection.query(
         query_embeddings=query_embedding,
         n_results=5,
-        where={"company_id": company_id_to_test}
     )
 
     # 4. Print the results
@@ -0,0 +1,82 @@
+# backend_api/tests/test_processing.py
+#
+# Run from backend_api/ with: python -m unittest discover -s tests -t .
+
+import os
+import random
+import unittest
+
+# app.processing builds its database engine and Cohere client at import time
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("COHERE_API_KEY", "test")
+
+from app.processing import CHUNK_SIZE, iter_chunks, make_text_splitter
+
+WORDS = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta", "iota", "kappa"]
+
+
+def _sample_text(words: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    lines, line = [], []
+    for _ in range(words):
+        line.append(rng.choice(WORDS))
+        if rng.random() < 0.08:
+            lines.append(" ".join(line))
+            line = []
+            if rng.random() < 0.3:
+                lines.append("")
+    lines.append(" ".join(line))
+    return "\n".join(lines)
+
+
+def _blocks(text: str, size: int):
+    return [(None, text[i:i + size]) for i in range(0, len(text), size)]
+
+
+class IterChunksTest(unittest.TestCase):
+    def assert_chunks_match_source(self, text: str, chunks: list[str]):
+        self.assertTrue(chunks)
+        for chunk in chunks:
+            self.assertIn(chunk, text)
+            self.assertLessEqual(len(chunk), CHUNK_SIZE)
+            for word in chunk.split():
+                self.assertIn(word, WORDS, f"split or merged word {word!r}")
+
+    def test_blocks_ending_on_whitespace_keep_words_apart(self):
+        text = _sample_text(20000)
+        # Block sizes that end blocks on spaces, newlines and mid-word
+        for size in (997, 1500, 4096, 64000):
+            with self.subTest(block_size=size):
+                chunks = [chunk for _, chunk in iter_chunks(_blocks(text, size), make_text_splitter())]
+                self.assert_chunks_match_source(text, chunks)
+
+    def test_block_boundary_on_space(self):
+        first = " ".join(["epsilon"] * 300) + " "
+        second = " ".join(["epsilon"] * 300)
+        chunks = [chunk for _, chunk in iter_chunks([(None, first), (None, second)], make_text_splitter())]
+        self.assert_chunks_match_source(first + second, chunks)
+
+    def test_block_boundary_mid_word(self):
+        text = _sample_text(5000, seed=1)
+        middle = len(text) // 2
+        while text[middle].isspace():
+            middle += 1
+        pieces = [(None, text[:middle]), (None, text[middle:])]
+        chunks = [chunk for _, chunk in iter_chunks(pieces, make_text_splitter())]
+        self.assert_chunks_match_source(text, chunks)
+
+    def test_pages_are_separated_and_numbered(self):
+        pieces = [(1, "page one ends here"), (2, "page two starts here")]
+        self.assertEqual(
+            list(iter_chunks(pieces, make_text_splitter())),
+            [(1, "page one ends here\npage two starts here")],
+        )
+        long_pages = [(page, " ".join(["theta"] * 400)) for page in (1, 2, 3)]
+        chunks = list(iter_chunks(long_pages, make_text_splitter()))
+        self.assertEqual(chunks[0][0], 1)
+        self.assertEqual(chunks[-1][0], 3)
+        self.assertEqual([page for page, _ in chunks], sorted(page for page, _ in chunks))
+
+
+if __name__ == "__main__":
+    unittest.main()
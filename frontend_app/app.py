@@ -1,11 +1,15 @@
 #frontend_app/app.py
 
+import time
 import streamlit as st
 import jwt
 from services import api_client
 
 st.set_page_config(page_title="Company Chatbot", layout="wide")
 
+# The ingestion progress panel reconnects to the backend's stream this often
+PROGRESS_SUBSCRIPTION_SECONDS = 30
+
 hide_streamlit_style = """
     <style>
     #MainMenu {visibility: hidden;}            /* Hides hamburger */
@@ -148,18 +152,24 @@ elif st.session_state.page == "admin":
 
     st.subheader("Upload Documents")
 
-    # PDF Upload
-    uploaded_file = st.file_uploader("Choose a PDF file", type=["pdf"])
-    if uploaded_file and st.button("Upload PDF"):
+    # File Upload (several files or zip archives at once)
+    uploaded_files = st.file_uploader(
+        "Choose PDF, HTML or text files, or zip archives of them",
+        type=["pdf", "html", "htm", "txt", "zip"],
+        accept_multiple_files=True,
+    )
+    if uploaded_files and st.button("Upload Files"):
         token = st.session_state.get('token')
         if token:
-            with st.spinner("Uploading and processing PDF..."):
-                response = api_client.upload_document(token, uploaded_file)
+            with st.spinner(f"Uploading {len(uploaded_files)} file(s)..."):
+                response = api_client.upload_documents_bulk(token, uploaded_files)
                 if response:
-                    st.success(f"Successfully uploaded '{uploaded_file.name}'!")
-                    st.rerun()
+                    st.success(response["message"])
+                    for result in response["files"]:
+                        if result["status"] != "queued":
+                            st.warning(f"{result['filename']}: {result['detail']}")
                 else:
-                    st.error("PDF upload failed. Please check backend logs.")
+                    st.error("Upload failed. Please check backend logs.")
 
     # URL Upload
     url_input = st.text_input("Or enter a URL to process")
@@ -174,6 +184,38 @@ elif st.session_state.page == "admin":
                 else:
                     st.error("URL upload failed. Please check backend logs.")
 
+    # Bulk URL / sitemap upload
+    with st.expander("Bulk import URLs or a sitemap"):
+        bulk_urls = st.text_area("URLs (one per line)")
+        sitemap_url = st.text_input("Sitemap URL")
+        if (bulk_urls.strip() or sitemap_url) and st.button("Import URLs"):
+            token = st.session_state.get('token')
+            urls = [line.strip() for line in bulk_urls.splitlines() if line.strip()]
+            response = api_client.upload_url_batch(token, urls, sitemap_url)
+            if response:
+                st.session_state.url_batch_id = response["batch_id"]
+                st.success(f"Batch {response['batch_id']} accepted; URLs are being fetched in the background.")
+            else:
+                st.error("URL batch upload failed. Please check backend logs.")
+
+        if st.session_state.get("url_batch_id"):
+            batch = api_client.get_url_batch(st.session_state.get('token'), st.session_state.url_batch_id)
+            if batch:
+                counts = batch["fetch_counts"]
+                st.write(
+                    f"Batch {batch['batch_id']} ({batch['status']}): {batch['total']} URLs, "
+                    f"{counts['queued']} fetched, {counts['failed']} failed, "
+                    f"{counts['pending'] + counts['fetching']} in progress, "
+                    f"{batch['ingestion_counts']['completed']} ingested"
+                )
+                failed = [item for item in batch["items"] if item["status"] == "failed"]
+                for item in failed:
+                    st.caption(f"{item['url']}: {item['error']}")
+                if st.button("Refresh batch status"):
+                    # Newly fetched URLs show up in the document list as well
+                    api_client.invalidate_documents_cache(st.session_state.get('token'))
+                    st.rerun()
+
     st.subheader("Uploaded Documents")
     token = st.session_state.get('token')
     documents = []
@@ -186,17 +228,33 @@ elif st.session_state.page == "admin":
             
             # Display filename
             cols[0].write(doc["filename"])
+            if doc.get("error_message"):
+                cols[0].caption(f"{doc['status']}: {doc['error_message']}")
             
             # Conditionally render Download button or URL link
             if doc.get("content_type") == "application/pdf":
-                # Render download button for PDFs
-                pdf_bytes = api_client.download_document(token, doc["id"])
-                if pdf_bytes:
-                    cols[1].download_button(
+                # PDF bytes are only fetched once the admin asks for them, and only
+                # the most recently prepared file is kept in the session
+                download_slot = cols[1].empty()
+                prepared = st.session_state.get("prepared_download")
+                if not (prepared and prepared["id"] == doc["id"]):
+                    prepared = None
+                    if download_slot.button("Prepare download", key=f"prepare_btn_{doc['id']}"):
+                        with st.spinner(f"Fetching '{doc['filename']}'..."):
+                            pdf_bytes = api_client.download_document(token, doc["id"])
+                        if pdf_bytes:
+                            prepared = {"id": doc["id"], "data": pdf_bytes}
+                            st.session_state.prepared_download = prepared
+                        else:
+                            st.error(f"Failed to download '{doc['filename']}'.")
+                if prepared:
+                    download_slot.download_button(
                         label="Download",
-                        data=pdf_bytes,
+                        data=prepared["data"],
                         file_name=doc["filename"],
-                        mime="application/pdf"
+                        mime="application/pdf",
+                        key=f"download_btn_{doc['id']}",
+                        on_click="ignore",
                     )
             elif doc.get("source_url"): # Check for the new source_url field
                 # Render a clickable URL for URL documents
@@ -210,6 +268,8 @@ elif st.session_state.page == "admin":
                 with st.spinner(f"Deleting '{doc['filename']}'..."):
                     success = api_client.delete_document(token, doc["id"])
                     if success:
+                        if st.session_state.get("prepared_download", {}).get("id") == doc["id"]:
+                            del st.session_state["prepared_download"]
                         st.success(f"Successfully deleted '{doc['filename']}'.")
                         st.rerun()
                     else:
@@ -217,6 +277,57 @@ elif st.session_state.page == "admin":
     else:
         st.info("No documents uploaded yet.")
 
+    # Live progress of documents still being ingested, pushed by the backend
+    in_flight = {
+        doc["id"]: doc for doc in documents
+        if doc.get("ingestion_stage") in ("queued", "extracting", "embedding", "retrying")
+    }
+    if token and in_flight:
+        st.subheader("Ingestion Progress")
+
+        # Runs as a fragment that listens for at most PROGRESS_SUBSCRIPTION_SECONDS
+        # and then reconnects, so the script is never held open indefinitely.
+        # Every keep-alive updates the page, which is when Streamlit handles
+        # clicks made in the meantime.
+        @st.fragment
+        def ingestion_progress():
+            progress_box = st.empty()
+            status_line = st.empty()
+
+            def render_progress():
+                with progress_box.container():
+                    for doc in in_flight.values():
+                        stats = doc.get("ingestion_stats") or {}
+                        line = f"**{doc['filename']}**: {doc['ingestion_stage']}"
+                        if stats:
+                            line += f" - {stats.get('chunks', 0)} chunks, {stats.get('added', 0)} stored"
+                        if doc.get("error_message"):
+                            line += f" (last error: {doc['error_message']})"
+                        st.write(line)
+
+            render_progress()
+            outcome = "timeout"
+            for event, data in api_client.stream_ingestion_progress(token, max_seconds=PROGRESS_SUBSCRIPTION_SECONDS):
+                if event == "progress":
+                    in_flight[data["id"]] = data
+                    render_progress()
+                elif event == "heartbeat":
+                    status_line.caption(f"Waiting for updates (last checked {time.strftime('%H:%M:%S')})")
+                elif event in ("idle", "error"):
+                    outcome = event
+                    break
+
+            if outcome == "idle":
+                # Everything finished: reload the document list once
+                api_client.invalidate_documents_cache(token)
+                st.rerun()
+            elif outcome == "error":
+                status_line.warning("Lost the connection to the progress stream. Reload the page to resume.")
+            else:
+                st.rerun(scope="fragment")
+
+        ingestion_progress()
+
 elif st.session_state.page == "chat":
     if not st.session_state.get("logged_in") or (
         st.session_state.get("role") not in ["user", "admin"]
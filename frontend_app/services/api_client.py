@@ -1,7 +1,13 @@
 #frontend_app/services/api_client.py
 
 import os
+import json
+import time
+import threading
+from collections import OrderedDict
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
 # Load the backend URL from the .env file
@@ -9,11 +15,101 @@ load_dotenv()
 BACKEND_URL = os.getenv("BACKEND_URL")
 print("BACKEND_URL:", BACKEND_URL)
 
+# --- HTTP client settings ---
+# (connect, read) timeouts in seconds. Whole-file uploads and downloads get more
+# time, and the read timeout of streams is the longest allowed gap between two chunks.
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "5"))
+API_TIMEOUT = (API_CONNECT_TIMEOUT, float(os.getenv("API_READ_TIMEOUT", "30")))
+TRANSFER_TIMEOUT = (API_CONNECT_TIMEOUT, float(os.getenv("API_TRANSFER_TIMEOUT", "300")))
+STREAM_TIMEOUT = (API_CONNECT_TIMEOUT, float(os.getenv("API_STREAM_TIMEOUT", "120")))
+# The backend sends a progress keep-alive at least every 5 seconds
+PROGRESS_STREAM_TIMEOUT = (API_CONNECT_TIMEOUT, 30)
+# Keep-alive connections kept open to the backend; Streamlit serves every
+# browser session from its own thread, all sharing this pool
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "20"))
+API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "2"))
+
+def _build_session() -> requests.Session:
+    # Only reads are retried: a retried upload or delete could be applied twice
+    retry = Retry(
+        total=API_MAX_RETRIES,
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD", "OPTIONS"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=API_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+_session = _build_session()
+
+def _request(method: str, path: str, timeout=API_TIMEOUT, **kwargs) -> requests.Response:
+    """
+    Sends a request to the backend over the shared session and logs its latency.
+    For streamed responses the latency is the time until the headers arrived.
+    """
+    start = time.perf_counter()
+    try:
+        response = _session.request(method, f"{BACKEND_URL}{path}", timeout=timeout, **kwargs)
+    except requests.exceptions.RequestException:
+        print(f"API {method} {path} failed after {(time.perf_counter() - start) * 1000:.0f} ms")
+        raise
+    print(f"API {method} {path} -> {response.status_code} in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return response
+
+# --- Response cache for list endpoints ---
+# Shared by all sessions of this Streamlit process and keyed by path and token.
+# Fresh entries are returned without a request; stale ones are revalidated with
+# If-None-Match, so an unchanged list costs one empty 304 response.
+DOCUMENTS_CACHE_TTL = float(os.getenv("DOCUMENTS_CACHE_TTL", "30"))
+COMPANIES_CACHE_TTL = float(os.getenv("COMPANIES_CACHE_TTL", "300"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+def _cached_get_json(path: str, headers: dict, ttl: float):
+    """GET a JSON response through the cache. Errors are raised and never cached."""
+    key = (path, headers.get("Authorization"))
+    with _response_cache_lock:
+        entry = _response_cache.get(key)
+    if entry and time.monotonic() - entry["fetched_at"] < ttl:
+        return entry["data"]
+
+    request_headers = dict(headers)
+    if entry and entry["etag"]:
+        request_headers["If-None-Match"] = entry["etag"]
+    response = _request("GET", path, headers=request_headers)
+    if response.status_code == 304 and entry:
+        data = entry["data"]
+    else:
+        response.raise_for_status()
+        data = response.json()
+
+    with _response_cache_lock:
+        _response_cache[key] = {
+            "data": data,
+            "etag": response.headers.get("ETag") or (entry and entry["etag"]),
+            "fetched_at": time.monotonic(),
+        }
+        _response_cache.move_to_end(key)
+        while len(_response_cache) > RESPONSE_CACHE_MAX_ENTRIES:
+            _response_cache.popitem(last=False)
+    return data
+
+def invalidate_documents_cache(token: str):
+    """Drops the cached document list, so the next get_documents call refetches it."""
+    with _response_cache_lock:
+        _response_cache.pop(("/documents/", f"Bearer {token}"), None)
+
 def login_user(email, password, company_id):
     """Sends login request to the backend API."""
     payload = {"email": email, "password": password, "company_id": company_id}
     try:
-        response = requests.post(f"{BACKEND_URL}/auth/login", json=payload)
+        response = _request("POST", "/auth/login", json=payload)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
@@ -28,7 +124,11 @@ def register_user(name, email, password, role, company_id):
         "role": role,
         "company_id": company_id
     }
-    response = requests.post(f"{BACKEND_URL}/auth/register", json=payload)
+    try:
+        response = _request("POST", "/auth/register", json=payload)
+    except requests.exceptions.RequestException as e:
+        print(f"Registration failed: {e}")
+        return None
     if response.status_code == 200:
         return response.json()
     return None
@@ -38,25 +138,68 @@ def upload_document(token: str, file):
     headers = {"Authorization": f"Bearer {token}"}
     files = {"file": (file.name, file, file.type)}
     try:
-        response = requests.post(f"{BACKEND_URL}/documents/upload", headers=headers, files=files)
+        response = _request("POST", "/documents/upload", headers=headers, files=files, timeout=TRANSFER_TIMEOUT)
         response.raise_for_status()
+        invalidate_documents_cache(token)
         return response.json()
     except requests.exceptions.RequestException as e:
         print(f"Upload failed: {e}")
         return None
 
+def upload_documents_bulk(token: str, files):
+    """Uploads several files (PDF, HTML, TXT or zip archives) in a single request."""
+    headers = {"Authorization": f"Bearer {token}"}
+    multipart = [("files", (file.name, file, file.type)) for file in files]
+    try:
+        response = _request(
+            "POST", "/documents/upload_bulk", headers=headers, files=multipart, timeout=TRANSFER_TIMEOUT
+        )
+        response.raise_for_status()
+        invalidate_documents_cache(token)
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        print(f"Bulk upload failed: {e}")
+        return None
+
 def upload_url_document(token: str, url: str):
     """Sends a URL document upload request to the backend API."""
     headers = {"Authorization": f"Bearer {token}"}
     payload = {"url": url}
     try:
-        response = requests.post(f"{BACKEND_URL}/documents/upload_url", headers=headers, json=payload)
+        response = _request(
+            "POST", "/documents/upload_url", headers=headers, json=payload, timeout=TRANSFER_TIMEOUT
+        )
         response.raise_for_status()
+        invalidate_documents_cache(token)
         return response.json()
     except requests.exceptions.RequestException as e:
         print(f"Upload URL failed: {e}")
         return None
 
+def upload_url_batch(token: str, urls: list[str], sitemap_url: str | None = None):
+    """Queues several URLs and/or a sitemap for background ingestion; returns the batch id."""
+    headers = {"Authorization": f"Bearer {token}"}
+    payload = {"urls": urls, "sitemap_url": sitemap_url or None}
+    try:
+        response = _request("POST", "/documents/upload_urls", headers=headers, json=payload)
+        response.raise_for_status()
+        invalidate_documents_cache(token)
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        print(f"Upload URL batch failed: {e}")
+        return None
+
+def get_url_batch(token: str, batch_id: int):
+    """Fetches the progress of a URL batch."""
+    headers = {"Authorization": f"Bearer {token}"}
+    try:
+        response = _request("GET", f"/documents/batches/{batch_id}", headers=headers)
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        print(f"Failed to fetch URL batch {batch_id}: {e}")
+        return None
+
 # New streaming function
 def query_chatbot_stream(token: str, query: str):
     """Sends a chat query to the backend API and yields streamed responses."""
@@ -64,10 +207,13 @@ def query_chatbot_stream(token: str, query: str):
     payload = {"query": query}
     try:
         # Use stream=True to keep the connection open and receive chunks
-        with requests.post(f"{BACKEND_URL}/chat/query_stream", headers=headers, json=payload, stream=True) as response:
+        with _request(
+            "POST", "/chat/query_stream", headers=headers, json=payload, stream=True, timeout=STREAM_TIMEOUT
+        ) as response:
             response.raise_for_status()
-            # Iterate over the response content, line by line
-            for chunk in response.iter_content(chunk_size=1024, decode_unicode=True):
+            # chunk_size=None yields whatever has arrived, so each token is shown
+            # as soon as the backend sends it instead of once 1 KB has built up
+            for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
                 yield chunk
     except requests.exceptions.RequestException as e:
         print(f"Query failed: {e}")
@@ -76,10 +222,7 @@ def query_chatbot_stream(token: str, query: str):
 def get_companies():
     """Fetches the list of all companies from the backend."""
     try:
-        response = requests.get(f"{BACKEND_URL}/companies/")
-        response.raise_for_status()
-        print("Companies response:", response.json())
-        return response.json()
+        return _cached_get_json("/companies/", {}, COMPANIES_CACHE_TTL)
     except requests.exceptions.RequestException as e:
         print(f"Failed to get companies: {e}")
         return []
@@ -88,18 +231,52 @@ def get_documents(token: str):
     """Fetch all documents for the current admin's company"""
     headers = {"Authorization": f"Bearer {token}"}
     try:
-        response = requests.get(f"{BACKEND_URL}/documents/", headers=headers)
-        response.raise_for_status()
-        return response.json()
+        return _cached_get_json("/documents/", headers, DOCUMENTS_CACHE_TTL)
     except requests.exceptions.RequestException as e:
         print(f"Failed to fetch documents: {e}")
         return []
 
+def stream_ingestion_progress(token: str, max_seconds: float | None = None):
+    """
+    Subscribes to the backend's server-sent ingestion progress stream and
+    yields (event, data) pairs until the backend reports that nothing is in
+    flight. Keep-alives are yielded as ("heartbeat", None) so the caller gets
+    control back every few seconds, the subscription ends after `max_seconds`,
+    and a failed connection is reported as ("error", message).
+    """
+    headers = {"Authorization": f"Bearer {token}", "Accept": "text/event-stream"}
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+    try:
+        with _request(
+            "GET", "/documents/progress/stream", headers=headers, stream=True, timeout=PROGRESS_STREAM_TIMEOUT
+        ) as response:
+            response.raise_for_status()
+            event, data = "message", []
+            # chunk_size=None hands over each keep-alive as it arrives instead of
+            # waiting for 512 bytes to build up
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                if line.startswith(":"):
+                    yield "heartbeat", None
+                elif line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data.append(line[len("data:"):].strip())
+                elif not line and data:
+                    yield event, json.loads("\n".join(data))
+                    event, data = "message", []
+                if deadline and time.monotonic() >= deadline:
+                    return
+    except requests.exceptions.RequestException as e:
+        print(f"Progress stream failed: {e}")
+        yield "error", str(e)
+
 def download_document(token: str, document_id: int):
     """Download PDF bytes from backend"""
     headers = {"Authorization": f"Bearer {token}"}
     try:
-        response = requests.get(f"{BACKEND_URL}/documents/download/{document_id}", headers=headers)
+        response = _request(
+            "GET", f"/documents/download/{document_id}", headers=headers, timeout=TRANSFER_TIMEOUT
+        )
         response.raise_for_status()
         return response.content
     except requests.exceptions.RequestException as e:
@@ -110,8 +287,9 @@ def delete_document(token: str, document_id: int):
     """Sends a delete document request to the backend API."""
     headers = {"Authorization": f"Bearer {token}"}
     try:
-        response = requests.delete(f"{BACKEND_URL}/documents/delete/{document_id}", headers=headers)
+        response = _request("DELETE", f"/documents/delete/{document_id}", headers=headers)
         response.raise_for_status()
+        invalidate_documents_cache(token)
         return True
     except requests.exceptions.RequestException as e:
         print(f"Failed to delete document {document_id}: {e}")